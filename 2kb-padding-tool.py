@@ -1,86 +1,237 @@
-import sys
-import os
-
-BLOCK_SIZE = 2048
-
-def process_file(filename):
-    """处理单个文件的核心逻辑"""
-    try:
-        size = os.path.getsize(filename)
-    except Exception as e:
-        print(f"\n⚠️ 错误文件 {filename}:")
-        print(f"    {str(e)}")
-        return False
-
-    remainder = size % BLOCK_SIZE
-    if remainder == 0:
-        print(f"✓ {filename} 已对齐 (大小 {size} 字节)")
-        return True
-
-    padding = BLOCK_SIZE - remainder
-    try:
-        with open(filename, 'ab') as f:
-            f.write(b'\x00' * padding)
-        new_size = size + padding
-        print(f"★ {filename} 填充成功:")
-        print(f"    原大小: {size:>8} 字节")
-        print(f"    填充量: {padding:>8} 字节")
-        print(f"    新大小: {new_size:>8} 字节 ({new_size // BLOCK_SIZE} 块)")
-        return True
-    except Exception as e:
-        print(f"\n⚠️ 写入失败 {filename}:")
-        print(f"    {str(e)}")
-        return False
-
-def batch_process(target_path):
-    """批量处理目录或单个文件"""
-    processed = 0
-    success = 0
-    failures = []
-
-    if os.path.isfile(target_path):
-        # 处理单个文件
-        processed += 1
-        if process_file(target_path):
-            success += 1
-        else:
-            failures.append(target_path)
-    else:
-        # 处理目录下所有文件
-        print(f"扫描目录: {os.path.abspath(target_path)}")
-        for entry in os.listdir(target_path):
-            full_path = os.path.join(target_path, entry)
-            if os.path.isfile(full_path):
-                processed += 1
-                if process_file(full_path):
-                    success += 1
-                else:
-                    failures.append(entry)
-
-    # 输出统计信息
-    print("\n" + "="*50)
-    print(f"处理完成: 总共 {processed} 个文件")
-    print(f"✓ 成功: {success}")
-    if failures:
-        print(f"⚠️ 失败: {len(failures)}")
-        print("\n失败文件列表:")
-        for f in failures:
-            print(f"  - {f}")
-
-def main():
-    # 处理命令行参数
-    if len(sys.argv) > 2:
-        print("使用方法: python pad_file.py [目录或文件路径]")
-        print("注意: 未指定路径时处理当前目录")
-        sys.exit(1)
-
-    target_path = sys.argv[1] if len(sys.argv) == 2 else "."
-    
-    if not os.path.exists(target_path):
-        print(f"错误路径: {target_path} 不存在")
-        sys.exit(1)
-
-    batch_process(target_path)
-
-if __name__ == "__main__":
-    main()
\ No newline at end of file
+import sys
+import os
+import csv
+import json
+import time
+import argparse
+
+import telemetry
+from telemetry import Progress
+from paddingtools import extend_file
+
+BLOCK_SIZE = 2048
+# 镜像生成时回退路径的复制缓冲区大小
+COPY_CHUNK = 4 << 20
+
+def process_file(filename, dense=False, quiet=False):
+    """处理单个文件的核心逻辑（quiet时只输出错误）"""
+    try:
+        size = os.path.getsize(filename)
+    except Exception as e:
+        print(f"\n⚠️ 错误文件 {filename}:")
+        print(f"    {str(e)}")
+        return False
+
+    remainder = size % BLOCK_SIZE
+    if remainder == 0:
+        if not quiet:
+            print(f"✓ {filename} 已对齐 (大小 {size} 字节)")
+        return True
+
+    padding = BLOCK_SIZE - remainder
+    try:
+        new_size = size + padding
+        with open(filename, 'r+b') as f:
+            extend_file(f, size, new_size, dense)
+        if not quiet:
+            print(f"★ {filename} 填充成功:")
+            print(f"    原大小: {size:>8} 字节")
+            print(f"    填充量: {padding:>8} 字节")
+            print(f"    新大小: {new_size:>8} 字节 ({new_size // BLOCK_SIZE} 块)")
+        return True
+    except Exception as e:
+        print(f"\n⚠️ 写入失败 {filename}:")
+        print(f"    {str(e)}")
+        return False
+
+def timed_process(filename, dense, progress):
+    """处理单个文件并记录耗时，字节数按填充量统计"""
+    start = time.perf_counter()
+    try:
+        size = os.path.getsize(filename)
+    except OSError:
+        # 文件在扫描后消失或不可读：交给process_file报告错误并计为失败
+        size = 0
+    ok = process_file(filename, dense, progress.quiet)
+    progress.file_done(filename, -size % BLOCK_SIZE if ok else 0, time.perf_counter() - start, ok)
+    return ok
+
+def batch_process(target_path, dense=False, progress=None):
+    """批量处理目录或单个文件"""
+    processed = 0
+    success = 0
+    failures = []
+    progress = progress or Progress("2kb")
+
+    if os.path.isfile(target_path):
+        # 处理单个文件
+        processed += 1
+        progress.add_total(1)
+        if timed_process(target_path, dense, progress):
+            success += 1
+        else:
+            failures.append(target_path)
+    else:
+        # 处理目录下所有文件
+        print(f"扫描目录: {os.path.abspath(target_path)}")
+        entries = [entry for entry in os.scandir(target_path) if entry.is_file()]
+        progress.add_total(len(entries))
+        for entry in entries:
+            processed += 1
+            if timed_process(entry.path, dense, progress):
+                success += 1
+            else:
+                failures.append(entry.name)
+    progress.finish()
+
+    # 输出统计信息
+    print("\n" + "="*50)
+    print(f"处理完成: 总共 {processed} 个文件")
+    print(f"✓ 成功: {success}")
+    if failures:
+        print(f"⚠️ 失败: {len(failures)}")
+        print("\n失败文件列表:")
+        for f in failures:
+            print(f"  - {f}")
+
+# -------------------------- 光盘镜像布局 --------------------------
+def plan_layout(paths, start_lba=0, exclude=()):
+    """一次规划：收集文件并按2048字节扇区对齐计算每个文件的LBA
+
+    目录会递归展开并按路径排序，列表文件（.txt/.lst）每行一个路径。
+    exclude为要跳过的文件（按realpath比较），用于排除上次生成的镜像及LBA表本身。
+    返回 [(镜像内名称, 源路径, LBA, 大小)] 以及镜像总扇区数。
+    """
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, names in os.walk(path):
+                dirs.sort()
+                for name in sorted(names):
+                    full_path = os.path.join(root, name)
+                    files.append((os.path.relpath(full_path, path).replace(os.sep, '/'), full_path))
+        elif path.lower().endswith(('.txt', '.lst')):
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    line = line.strip()
+                    if line:
+                        files.append((line.replace(os.sep, '/'), line))
+        else:
+            files.append((os.path.basename(path), path))
+
+    excluded = {os.path.realpath(path) for path in exclude}
+    files = [(name, full_path) for name, full_path in files if os.path.realpath(full_path) not in excluded]
+
+    layout = []
+    lba = start_lba
+    for name, full_path in files:
+        size = os.stat(full_path).st_size
+        layout.append((name, full_path, lba, size))
+        lba += (size + BLOCK_SIZE - 1) // BLOCK_SIZE
+    return layout, lba
+
+def copy_into(src, out, size, dst_offset):
+    """把源文件完整复制到镜像的dst_offset处，优先使用内核内的copy_file_range"""
+    if hasattr(os, 'copy_file_range'):
+        try:
+            copied = 0
+            while copied < size:
+                n = os.copy_file_range(src.fileno(), out.fileno(), size - copied,
+                                       copied, dst_offset + copied)
+                if n == 0:
+                    break
+                copied += n
+            if copied == size:
+                return
+        except OSError:
+            pass
+
+    # 回退：大块缓冲区读写
+    src.seek(0)
+    out.seek(dst_offset)
+    remaining = size
+    while remaining > 0:
+        chunk = src.read(min(COPY_CHUNK, remaining))
+        if not chunk:
+            break
+        out.write(chunk)
+        remaining -= len(chunk)
+
+def write_table(layout, table_path):
+    """输出LBA表，扩展名为.json时写JSON，否则写CSV"""
+    if table_path.lower().endswith('.json'):
+        with open(table_path, 'w', encoding='utf-8') as f:
+            json.dump([{"name": name, "lba": lba, "size": size,
+                        "blocks": (size + BLOCK_SIZE - 1) // BLOCK_SIZE}
+                       for name, _, lba, size in layout], f, ensure_ascii=False, indent=1)
+    else:
+        with open(table_path, 'w', encoding='utf-8', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(["name", "lba", "size", "blocks"])
+            for name, _, lba, size in layout:
+                writer.writerow([name, lba, size, (size + BLOCK_SIZE - 1) // BLOCK_SIZE])
+
+def build_image(paths, image_path, table_path=None, start_lba=0, progress=None):
+    """把所有文件按扇区对齐写入单个镜像文件，源文件保持不变"""
+    # 在同一目录中重新生成时，不能把旧的镜像和LBA表当作输入
+    layout, end_lba = plan_layout(paths, start_lba, [path for path in (image_path, table_path) if path])
+    base = start_lba * BLOCK_SIZE
+    progress = progress or Progress("image")
+    progress.add_total(len(layout), sum(item[3] for item in layout))
+
+    with open(image_path, 'wb') as out:
+        for name, full_path, lba, size in layout:
+            start = time.perf_counter()
+            with open(full_path, 'rb') as src:
+                copy_into(src, out, size, lba * BLOCK_SIZE - base)
+            progress.file_done(full_path, size, time.perf_counter() - start, lba=lba)
+        # 文件之间的空隙和末尾对齐部分由truncate补零
+        out.truncate(end_lba * BLOCK_SIZE - base)
+    progress.finish()
+
+    if table_path:
+        write_table(layout, table_path)
+
+    print("\n" + "="*50)
+    print(f"镜像生成完成: {image_path}")
+    print(f"  文件数: {len(layout)}")
+    print(f"  扇区数: {end_lba - start_lba} ({(end_lba - start_lba) * BLOCK_SIZE} 字节)")
+    if table_path:
+        print(f"  LBA表: {table_path}")
+    return layout
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="2048字节扇区对齐工具\n"
+                    "默认原地填充文件；指定 --image 时生成单个对齐镜像及LBA表，不修改源文件",
+        formatter_class=argparse.RawTextHelpFormatter
+    )
+    parser.add_argument("paths", nargs='*', default=["."],
+                        help="目录或文件路径（未指定时处理当前目录）\n--image 模式下也可以是每行一个路径的 .txt/.lst 列表")
+    parser.add_argument("--dense", action="store_true",
+                        help="实际分配填充区域的磁盘空间（默认生成稀疏文件）")
+    parser.add_argument("--image", metavar="OUTPUT", help="生成扇区对齐的镜像文件")
+    parser.add_argument("--table", metavar="TABLE",
+                        help="输出LBA表（.json 或 .csv，默认：镜像路径 + .lba.csv）")
+    parser.add_argument("--start-lba", type=int, default=0, help="第一个文件的起始LBA（默认：0）")
+    telemetry.add_arguments(parser)
+    args = parser.parse_args()
+    progress = Progress("image" if args.image else "2kb", live=args.progress,
+                        jsonl_path=args.log_jsonl, quiet=args.quiet)
+
+    for target_path in args.paths:
+        if not os.path.exists(target_path):
+            print(f"错误路径: {target_path} 不存在")
+            sys.exit(1)
+
+    if args.image:
+        build_image(args.paths, args.image, args.table or args.image + ".lba.csv", args.start_lba, progress)
+        return
+
+    if len(args.paths) > 1:
+        print("原地填充模式一次只处理一个目录或文件")
+        sys.exit(1)
+    batch_process(args.paths[0], args.dense, progress)
+
+if __name__ == "__main__":
+    main()
@@ -1,46 +1,380 @@
-import sys
-
-def process_tm2_alpha(input_path, output_path):
-    # 读取文件内容到bytearray以便修改
-    with open(input_path, 'rb') as f:
-        data = bytearray(f.read())
-    
-    # 验证文件头
-    if len(data) < 64 or data[0:4] != b'TIM2':
-        raise ValueError("Invalid TM2 file format")
-    
-    # 读取色位数（小端序）
-    n = int.from_bytes(data[30:32], byteorder='little')
-    if n <= 0:
-        raise ValueError("Invalid color depth value")
-    
-    # 计算调色板位置和大小
-    file_size = len(data)
-    palette_size = 4 * n
-    palette_start = file_size - palette_size
-    
-    # 验证调色板位置有效性
-    if palette_start < 64 or palette_start + palette_size > file_size:
-        raise ValueError("Invalid palette position")
-    
-    # 处理每个调色板项的alpha通道
-    for i in range(n):
-        alpha_pos = palette_start + i * 4 + 3
-        original = data[alpha_pos]
-        data[alpha_pos] = (original + 1) // 2  # 向上取整处理
-    
-    # 写入输出文件
-    with open(output_path, 'wb') as f:
-        f.write(data)
-
-if __name__ == "__main__":
-    if len(sys.argv) != 3:
-        print("Usage: python tm2_alpha_adjust.py <input.tm2> <output.tm2>")
-        sys.exit(1)
-    
-    try:
-        process_tm2_alpha(sys.argv[1], sys.argv[2])
-        print("Alpha channel processing completed successfully")
-    except Exception as e:
-        print(f"Error processing file: {str(e)}")
-        sys.exit(1)
\ No newline at end of file
+import os
+import sys
+import glob
+import json
+import mmap
+import zlib
+import shutil
+import struct
+import fnmatch
+import hashlib
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+# 预先计算的alpha转换表（256项），配合bytes.translate批量处理
+# PS2→PC：alpha减半（向上取整）
+ALPHA_HALVE_TABLE = bytes((a + 1) // 2 for a in range(256))
+# PC→PS2：alpha加倍（上限255）
+ALPHA_DOUBLE_TABLE = bytes(min(a * 2, 255) for a in range(256))
+
+def convert_alpha(data, start, end, table):
+    """对 data[start:end] 中每个调色板项的第4字节（alpha）批量查表转换"""
+    alpha = slice(start + 3, end, 4)
+    data[alpha] = data[alpha].translate(table)
+
+def parse_tim2(data):
+    """解析TIM2文件头及全部图片头，返回每张图片的信息字典列表
+
+    每项包含图片头偏移、图像数据与CLUT的绝对位置/大小以及格式字段，
+    CLUT位置按 图片头 + 头大小 + 图像大小 精确计算，不再假设调色板位于文件末尾。
+    """
+    if len(data) < 16 or data[0:4] != b'TIM2':
+        raise ValueError("Invalid TM2 file format")
+
+    picture_count = int.from_bytes(data[6:8], 'little')
+    # 格式字段为1时文件头按128字节对齐
+    offset = 128 if data[5] == 1 else 16
+
+    pictures = []
+    for index in range(picture_count):
+        if offset + 48 > len(data):
+            raise ValueError(f"Picture {index} header out of range")
+        total_size = int.from_bytes(data[offset:offset + 4], 'little')
+        clut_size = int.from_bytes(data[offset + 4:offset + 8], 'little')
+        image_size = int.from_bytes(data[offset + 8:offset + 12], 'little')
+        header_size = int.from_bytes(data[offset + 12:offset + 14], 'little')
+        picture = {
+            "offset": offset,
+            "clut_colors": int.from_bytes(data[offset + 14:offset + 16], 'little'),
+            "mipmaps": data[offset + 17],
+            "clut_type": data[offset + 18],
+            "image_type": data[offset + 19],
+            "width": int.from_bytes(data[offset + 20:offset + 22], 'little'),
+            "height": int.from_bytes(data[offset + 22:offset + 24], 'little'),
+            "image_start": offset + header_size,
+            "image_size": image_size,
+            "clut_start": offset + header_size + image_size,
+            "clut_size": clut_size,
+        }
+        if total_size < header_size + image_size + clut_size or offset + total_size > len(data):
+            raise ValueError(f"Invalid size fields in picture {index}")
+        pictures.append(picture)
+        offset += total_size
+
+    return pictures
+
+def process_tm2_alpha(input_path, output_path, reverse=False):
+    # 输出到其他路径时先复制，之后统一在输出文件上原地修改
+    copied = os.path.abspath(input_path) != os.path.abspath(output_path)
+    if copied:
+        shutil.copyfile(input_path, output_path)
+
+    table = ALPHA_DOUBLE_TABLE if reverse else ALPHA_HALVE_TABLE
+    try:
+        # 通过读写mmap原地修改，只触及调色板所在的页，不重写像素数据
+        with open(output_path, 'r+b') as f, mmap.mmap(f.fileno(), 0) as data:
+            # 先完整解析再修改，避免无效文件被改动一半
+            palettes = [picture for picture in parse_tim2(data)
+                        # 只有32位CLUT（RGBA8888）带有完整的alpha通道
+                        if picture["clut_size"] and picture["clut_type"] & 0x3F == 3]
+            if not palettes:
+                raise ValueError("No 32-bit palette found")
+            for picture in palettes:
+                start = picture["clut_start"]
+                convert_alpha(data, start, start + picture["clut_size"], table)
+            data.flush()
+    except Exception:
+        if copied:
+            os.remove(output_path)
+        raise
+
+    return len(palettes)
+
+# -------------------------- TIM2 → PNG --------------------------
+# 图像类型 -> 每像素位数（1:16位 2:24位 3:32位 4:4位索引 5:8位索引）
+IMAGE_BPP = {1: 16, 2: 24, 3: 32, 4: 4, 5: 8}
+# CLUT类型最高位为0时是CSM1排列，8位索引的256色调色板每32色中第8~15与16~23色互换
+CLUT_CSM2 = 0x80
+
+def scale5(v):
+    return (v << 3) | (v >> 2)
+
+# 16位像素（RGBA5551，小端）按低/高字节分别查表拆出各分量
+R5_TABLE = bytes(scale5(v & 0x1F) for v in range(256))
+G_LOW_TABLE = bytes(v >> 5 for v in range(256))
+G_HIGH_TABLE = bytes((v & 0x03) << 3 for v in range(256))
+SCALE5_TABLE = bytes(scale5(v & 0x1F) for v in range(256))
+B5_TABLE = bytes(scale5((v >> 2) & 0x1F) for v in range(256))
+A1_TABLE = bytes(255 if v & 0x80 else 0 for v in range(256))
+# 4位索引：每字节低4位在前
+LOW_NIBBLE_TABLE = bytes(v & 0x0F for v in range(256))
+HIGH_NIBBLE_TABLE = bytes(v >> 4 for v in range(256))
+# PS2的alpha以0x80为不透明，导出时放大到0~255
+PNG_ALPHA_TABLES = {"ps2": ALPHA_DOUBLE_TABLE, "full": bytes(range(256))}
+# 预览用途以速度优先：解码只需不到1毫秒，PNG压缩才是主要耗时，级别1比默认级别快数倍
+PNG_COMPRESSION_LEVEL = 1
+
+def rgba_from_16bit(data, alpha_table=None):
+    """RGBA5551 -> RGBA8888；G分量跨两个字节，两部分位不重叠，用大整数按位或一次合并"""
+    low, high = data[0::2], data[1::2]
+    count = len(low)
+    out = bytearray(4 * count)
+    out[0::4] = low.translate(R5_TABLE)
+    green = (int.from_bytes(low.translate(G_LOW_TABLE), 'little') |
+             int.from_bytes(high.translate(G_HIGH_TABLE), 'little')).to_bytes(count, 'little')
+    out[1::4] = green.translate(SCALE5_TABLE)
+    out[2::4] = high.translate(B5_TABLE)
+    out[3::4] = high.translate(A1_TABLE)
+    return out
+
+def rgba_from_24bit(data, alpha_table=None):
+    count = len(data) // 3
+    out = bytearray(b'\xff' * (4 * count))
+    for channel in range(3):
+        out[channel::4] = data[channel::3]
+    return out
+
+def rgba_from_32bit(data, alpha_table):
+    out = bytearray(data)
+    convert_alpha(out, 0, len(out), alpha_table)
+    return out
+
+RGBA_DECODERS = {1: rgba_from_16bit, 2: rgba_from_24bit, 3: rgba_from_32bit}
+
+def decode_palette(data, picture, alpha_table):
+    """把CLUT解码为RGBA，8位索引的CSM1调色板还原为线性顺序"""
+    clut_format = picture["clut_type"] & 0x3F
+    if clut_format not in RGBA_DECODERS:
+        raise ValueError(f"Unsupported CLUT type {picture['clut_type']:#x}")
+    entry_size = IMAGE_BPP[clut_format] // 8
+    colors = min(picture["clut_colors"], picture["clut_size"] // entry_size, 256)
+    start = picture["clut_start"]
+    palette = RGBA_DECODERS[clut_format](bytes(data[start:start + colors * entry_size]), alpha_table)
+
+    if picture["image_type"] == 5 and not picture["clut_type"] & CLUT_CSM2:
+        for block in range(0, len(palette) - 95, 128):
+            palette[block + 32:block + 64], palette[block + 64:block + 96] = \
+                palette[block + 64:block + 96], palette[block + 32:block + 64]
+    return palette + bytes(4 * 256 - len(palette))
+
+def decode_picture(data, picture, alpha_table):
+    """把一张图片的第一级mipmap解码为RGBA8888，返回 (宽, 高, 像素)"""
+    width, height, image_type = picture["width"], picture["height"], picture["image_type"]
+    if image_type not in IMAGE_BPP:
+        raise ValueError(f"Unsupported image type {image_type}")
+    row_bytes = (width * IMAGE_BPP[image_type] + 7) // 8
+    if row_bytes * height > picture["image_size"]:
+        raise ValueError("Image data smaller than picture dimensions")
+    start = picture["image_start"]
+    pixels = bytes(data[start:start + row_bytes * height])
+
+    if image_type in RGBA_DECODERS:
+        return width, height, RGBA_DECODERS[image_type](pixels, alpha_table)
+
+    if image_type == 4:
+        indices = bytearray(2 * len(pixels))
+        indices[0::2] = pixels.translate(LOW_NIBBLE_TABLE)
+        indices[1::2] = pixels.translate(HIGH_NIBBLE_TABLE)
+        if width % 2:
+            # 奇数宽度时每行末尾多出半个字节
+            indices = b''.join(indices[y * 2 * row_bytes:y * 2 * row_bytes + width] for y in range(height))
+    else:
+        indices = pixels
+
+    # 调色板的每个分量各作为一张256项转换表，索引整体查表得到RGBA
+    palette = decode_palette(data, picture, alpha_table)
+    rgba = bytearray(4 * len(indices))
+    for channel in range(4):
+        rgba[channel::4] = bytes(indices).translate(palette[channel::4])
+    return width, height, rgba
+
+def png_chunk(tag, payload):
+    return struct.pack('>I', len(payload)) + tag + payload + struct.pack('>I', zlib.crc32(tag + payload))
+
+def write_png(path, width, height, rgba, level=PNG_COMPRESSION_LEVEL):
+    """只用zlib写出RGBA8 PNG（每行过滤类型0）"""
+    stride = width * 4
+    raw = b''.join(b'\x00' + rgba[y * stride:(y + 1) * stride] for y in range(height))
+    with open(path, 'wb') as f:
+        f.write(b'\x89PNG\r\n\x1a\n')
+        f.write(png_chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 6, 0, 0, 0)))
+        f.write(png_chunk(b'IDAT', zlib.compress(raw, level)))
+        f.write(png_chunk(b'IEND', b''))
+
+def export_tm2_png(input_path, output_path, alpha="ps2"):
+    """把TIM2中的每张图片导出为PNG，多张图片时第2张起输出为 name_1.png、name_2.png…"""
+    alpha_table = PNG_ALPHA_TABLES[alpha]
+    with open(input_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        pictures = [decode_picture(data, picture, alpha_table) for picture in parse_tim2(data)]
+
+    base, ext = os.path.splitext(output_path)
+    for index, (width, height, rgba) in enumerate(pictures):
+        write_png(output_path if index == 0 else f"{base}_{index}{ext}", width, height, rgba)
+    return len(pictures)
+
+# -------------------------- 批量处理 --------------------------
+def file_digest(path):
+    """计算文件的SHA-1，用于判断文件是否变化"""
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def collect_jobs(inputs, output_dir, recursive=False, pattern="*.tm2"):
+    """展开文件/目录/通配符输入，返回 (输入路径, 输出路径) 列表
+
+    目录与通配符输入会在输出目录下保留相对目录结构；output_dir为None时原地处理。
+    """
+    jobs = []
+    for item in inputs:
+        if os.path.isdir(item):
+            root = item
+            if recursive:
+                matches = [os.path.join(dirpath, name)
+                           for dirpath, _, names in os.walk(item)
+                           for name in names if fnmatch.fnmatch(name.lower(), pattern.lower())]
+            else:
+                matches = [entry.path for entry in os.scandir(item)
+                           if entry.is_file() and fnmatch.fnmatch(entry.name.lower(), pattern.lower())]
+        elif glob.has_magic(item):
+            # 通配符之前的目录部分作为相对路径的根
+            root = item
+            while glob.has_magic(root):
+                root = os.path.dirname(root)
+            matches = [path for path in glob.glob(item, recursive=True) if os.path.isfile(path)]
+        else:
+            root = os.path.dirname(item)
+            matches = [item]
+
+        for path in sorted(matches):
+            if output_dir is None:
+                jobs.append((path, path))
+            else:
+                jobs.append((path, os.path.join(output_dir, os.path.relpath(path, root or "."))))
+    return jobs
+
+def convert_job(input_path, output_path, reverse=False, skip=None, record=None, png=None):
+    """处理单个批量任务（在进程池中运行），返回 (状态, 输入SHA-1, 输出SHA-1, 错误信息)
+
+    png为alpha处理方式（"ps2"/"full"）时导出PNG，否则转换调色板alpha。
+    """
+    try:
+        in_place = os.path.abspath(input_path) == os.path.abspath(output_path)
+        if skip == "mtime" and not in_place and os.path.exists(output_path):
+            if os.path.getmtime(output_path) >= os.path.getmtime(input_path):
+                return "skipped", None, None, None
+
+        input_hash = None
+        if skip == "hash":
+            input_hash = file_digest(input_path)
+            if record and os.path.exists(output_path):
+                # 原地处理时输入即输出，只需比较处理后的哈希
+                if (in_place or input_hash == record[0]) and \
+                        (input_hash if in_place else file_digest(output_path)) == record[1]:
+                    return "skipped", record[0], record[1], None
+
+        os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+        if png:
+            export_tm2_png(input_path, output_path, png)
+        else:
+            process_tm2_alpha(input_path, output_path, reverse)
+        output_hash = file_digest(output_path) if skip == "hash" else None
+        return "done", input_hash, output_hash, None
+    except Exception as e:
+        return "failed", None, None, str(e)
+
+def batch_process(jobs, reverse=False, workers=0, skip=None, state_path=None, png=None):
+    """用进程池并行处理全部任务，并输出统计信息"""
+    state = {}
+    if skip == "hash" and state_path and os.path.exists(state_path):
+        with open(state_path, 'r', encoding='utf-8') as f:
+            state = json.load(f)
+
+    counts = {"done": 0, "skipped": 0, "failed": 0}
+    failures = []
+    with ProcessPoolExecutor(max_workers=workers or None) as pool:
+        futures = {pool.submit(convert_job, src, dst, reverse, skip,
+                               state.get(os.path.abspath(dst)), png): (src, dst)
+                   for src, dst in jobs}
+        for future in as_completed(futures):
+            src, dst = futures[future]
+            status, input_hash, output_hash, error = future.result()
+            counts[status] += 1
+            if status == "failed":
+                failures.append((src, error))
+            elif skip == "hash":
+                state[os.path.abspath(dst)] = [input_hash, output_hash]
+
+    if skip == "hash" and state_path:
+        with open(state_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f, indent=1)
+
+    print("\n" + "=" * 50)
+    print(f"处理完成: 总共 {len(jobs)} 个文件")
+    print(f"成功: {counts['done']}  跳过: {counts['skipped']}  失败: {counts['failed']}")
+    for src, error in failures:
+        print(f"  - {src}: {error}")
+    return counts
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="TIM2调色板alpha转换工具\n"
+                    "单文件: TM2-alpha-tool.py input.tm2 output.tm2\n"
+                    "批量:   TM2-alpha-tool.py textures/ -R -o converted/ -j 8\n"
+                    "        TM2-alpha-tool.py 'data/**/*.tm2' --in-place --skip-unchanged hash\n"
+                    "导出PNG: TM2-alpha-tool.py --png input.tm2 output.png\n"
+                    "        TM2-alpha-tool.py --png textures/ -R -o previews/ -j 8",
+        formatter_class=argparse.RawTextHelpFormatter
+    )
+    parser.add_argument("inputs", nargs='+',
+                        help="输入TM2文件、目录或通配符（单文件模式下最后一个为输出文件）")
+    parser.add_argument("-o", "--output", help="批量模式输出目录（保留相对目录结构）")
+    parser.add_argument("-i", "--in-place", action="store_true", help="批量模式原地修改文件")
+    parser.add_argument("-R", "--recursive", action="store_true", help="递归处理子目录")
+    parser.add_argument("--pattern", default="*.tm2", help="目录输入时的文件名匹配（默认：*.tm2）")
+    parser.add_argument("-j", "--jobs", type=int, default=0, help="并行进程数（默认：CPU核心数）")
+    parser.add_argument("--skip-unchanged", choices=["mtime", "hash"],
+                        help="跳过未变化的文件：mtime 比较修改时间，hash 比较记录的SHA-1")
+    parser.add_argument("--state", help="hash模式的状态文件（默认：输出目录或当前目录下的 .tm2-alpha-state.json）")
+    parser.add_argument("-r", "--reverse", action="store_true",
+                        help="反向转换：PC→PS2（alpha加倍）")
+    parser.add_argument("--png", action="store_true",
+                        help="把图片解码为RGBA并导出PNG（4/8位索引及16/24/32位），不修改原文件\n"
+                             "批量模式下输出扩展名改为 .png，--in-place 时写在原文件旁")
+    parser.add_argument("--png-alpha", choices=sorted(PNG_ALPHA_TABLES), default="ps2",
+                        help="PNG的alpha：ps2 以0x80为不透明并放大到255（默认），full 按原值输出")
+    args = parser.parse_args()
+    png = args.png_alpha if args.png else None
+
+    # 兼容旧用法：恰好两个文件路径且未指定批量选项
+    if len(args.inputs) == 2 and not (args.output or args.in_place) and os.path.isfile(args.inputs[0]):
+        try:
+            if png:
+                count = export_tm2_png(args.inputs[0], args.inputs[1], png)
+                print(f"PNG export completed successfully ({count} picture(s))")
+            else:
+                process_tm2_alpha(args.inputs[0], args.inputs[1], args.reverse)
+                print("Alpha channel processing completed successfully")
+        except Exception as e:
+            print(f"Error processing file: {str(e)}")
+            sys.exit(1)
+        sys.exit(0)
+
+    if bool(args.output) == bool(args.in_place):
+        print("批量模式需要指定 -o 输出目录或 --in-place 其中之一")
+        sys.exit(1)
+    if args.skip_unchanged == "mtime" and args.in_place and not png:
+        print("原地处理无法使用 mtime 判断，请改用 --skip-unchanged hash")
+        sys.exit(1)
+
+    jobs = collect_jobs(args.inputs, None if args.in_place else args.output,
+                        args.recursive, args.pattern)
+    if not jobs:
+        print("没有找到可处理的文件")
+        sys.exit(1)
+    if png:
+        jobs = [(src, os.path.splitext(dst)[0] + ".png") for src, dst in jobs]
+    state_path = args.state or os.path.join(args.output or ".", ".tm2-alpha-state.json")
+    counts = batch_process(jobs, args.reverse, args.jobs, args.skip_unchanged, state_path, png)
+    sys.exit(1 if counts["failed"] else 0)
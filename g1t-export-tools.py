@@ -1,118 +1,283 @@
-import os
-import sys
-import argparse
-
-def process_single_file(input_path, output_dir, verbose=False):
-    """处理单个文件的核心逻辑"""
-    try:
-        base_name = os.path.splitext(os.path.basename(input_path))[0]
-        counter = 1
-        
-        with open(input_path, 'rb') as f:
-            # 读取文件数量
-            num_files_bytes = f.read(4)
-            num_files = int.from_bytes(num_files_bytes, 'little')
-
-            # 读取所有文件块大小
-            sizes = []
-            for _ in range(num_files):
-                size_bytes = f.read(4)
-                size = int.from_bytes(size_bytes, 'little') * 16
-                sizes.append(size)
-
-            # 计算文件头填充
-            header_size = 4 + 4 * num_files
-            padding = (16 - (header_size % 16)) % 16
-            f.read(padding)
-            
-            # 计算偏移量
-            offsets = []
-            current_offset = header_size + padding
-            for size in sizes:
-                offsets.append(current_offset)
-                current_offset += size
-
-            # 处理每个文件块
-            for idx, (offset, size) in enumerate(zip(offsets, sizes)):
-                f.seek(offset)
-                file_data = f.read(size)
-                
-                if len(file_data) >= 16 and file_data[:4] == b'GT1G':
-                    g1t_size = int.from_bytes(file_data[8:12], 'little')
-                    valid_size = min(g1t_size, len(file_data))
-                    
-                    # 生成带源文件名的输出路径
-                    output_filename = f"{base_name}_{counter:04d}.g1t"
-                    output_path = os.path.join(output_dir, output_filename)
-                    
-                    with open(output_path, 'wb') as out_file:
-                        out_file.write(file_data[:valid_size])
-                    
-                    if verbose:
-                        print(f"从 {os.path.basename(input_path)} 提取 {output_filename}")
-                    counter += 1
-
-            return True
-    except Exception as e:
-        print(f"处理 {os.path.basename(input_path)} 失败: {str(e)}")
-        return False
-
-def batch_process(input_path, output_dir, verbose=False):
-    """批量处理入口"""
-    # 创建输出目录
-    os.makedirs(output_dir, exist_ok=True)
-    
-    processed_files = 0
-    success_count = 0
-    
-    # 判断输入类型
-    if os.path.isfile(input_path):
-        # 处理单个文件
-        if process_single_file(input_path, output_dir, verbose):
-            success_count += 1
-        processed_files += 1
-    elif os.path.isdir(input_path):
-        # 遍历目录下的所有文件
-        for filename in os.listdir(input_path):
-            file_path = os.path.join(input_path, filename)
-            if os.path.isfile(file_path):
-                if process_single_file(file_path, output_dir, verbose):
-                    success_count += 1
-                processed_files += 1
-    else:
-        raise ValueError("无效的输入路径")
-
-    print(f"\n处理完成！成功处理 {success_count}/{processed_files} 个文件")
-
-if __name__ == "__main__":
-    parser = argparse.ArgumentParser(
-        description="G1T文件批量提取工具",
-        formatter_class=argparse.RawTextHelpFormatter
-    )
-    parser.add_argument("input", 
-                      help="输入文件或目录路径")
-    parser.add_argument("-o", "--output",
-                      default="extracted_g1t",
-                      help="输出目录（默认：extracted_g1t）")
-    parser.add_argument("-v", "--verbose",
-                      action="store_true",
-                      help="显示详细处理信息")
-    
-    args = parser.parse_args()
-
-    # 输入路径验证
-    if not os.path.exists(args.input):
-        print(f"错误：输入路径 '{args.input}' 不存在")
-        sys.exit(1)
-
-    print("\n" + "="*50)
-    print(f" 批量处理启动")
-    print(f" 输入路径: {args.input}")
-    print(f" 输出目录: {args.output}")
-    print("="*50)
-    
-    try:
-        batch_process(args.input, args.output, args.verbose)
-    except Exception as e:
-        print(f"\n[错误] {str(e)}")
+import os
+import sys
+import mmap
+import time
+import struct
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+import telemetry
+from telemetry import Progress
+
+def process_single_file(input_path, output_dir, verbose=False, dds=False, jobs=0):
+    """处理单个文件的核心逻辑；dds时直接把其中的纹理导出为DDS"""
+    if dds:
+        return export_pack_dds(input_path, output_dir, verbose, jobs)
+    try:
+        base_name = os.path.splitext(os.path.basename(input_path))[0]
+        counter = 1
+        
+        with open(input_path, 'rb') as f:
+            # 读取文件数量
+            num_files_bytes = f.read(4)
+            num_files = int.from_bytes(num_files_bytes, 'little')
+
+            # 读取所有文件块大小
+            sizes = []
+            for _ in range(num_files):
+                size_bytes = f.read(4)
+                size = int.from_bytes(size_bytes, 'little') * 16
+                sizes.append(size)
+
+            # 计算文件头填充
+            header_size = 4 + 4 * num_files
+            padding = (16 - (header_size % 16)) % 16
+            f.read(padding)
+            
+            # 计算偏移量
+            offsets = []
+            current_offset = header_size + padding
+            for size in sizes:
+                offsets.append(current_offset)
+                current_offset += size
+
+            # 处理每个文件块
+            for idx, (offset, size) in enumerate(zip(offsets, sizes)):
+                f.seek(offset)
+                file_data = f.read(size)
+                
+                if len(file_data) >= 16 and file_data[:4] == b'GT1G':
+                    g1t_size = int.from_bytes(file_data[8:12], 'little')
+                    valid_size = min(g1t_size, len(file_data))
+                    
+                    # 生成带源文件名的输出路径
+                    output_filename = f"{base_name}_{counter:04d}.g1t"
+                    output_path = os.path.join(output_dir, output_filename)
+                    
+                    with open(output_path, 'wb') as out_file:
+                        out_file.write(file_data[:valid_size])
+                    
+                    if verbose:
+                        print(f"从 {os.path.basename(input_path)} 提取 {output_filename}")
+                    counter += 1
+
+            return True
+    except Exception as e:
+        print(f"处理 {os.path.basename(input_path)} 失败: {str(e)}")
+        return False
+
+# -------------------------- G1T → DDS --------------------------
+# G1T纹理格式 -> (类型, DDS FourCC或DXGI格式, 每4x4块字节数或每像素字节数, RGBA掩码)
+# 只列出线性存储（PC版）的格式，主机平台的分块/交错格式不在此列
+G1T_FORMATS = {
+    0x00: ("rgba", None, 4, (0x000000FF, 0x0000FF00, 0x00FF0000, 0xFF000000)),
+    0x01: ("rgba", None, 4, (0x00FF0000, 0x0000FF00, 0x000000FF, 0xFF000000)),
+    0x06: ("fourcc", b'DXT1', 8, None),
+    0x07: ("fourcc", b'DXT3', 16, None),
+    0x08: ("fourcc", b'DXT5', 16, None),
+    0x59: ("fourcc", b'DXT1', 8, None),
+    0x5A: ("fourcc", b'DXT3', 16, None),
+    0x5B: ("fourcc", b'DXT5', 16, None),
+    0x5C: ("fourcc", b'ATI1', 8, None),
+    0x5D: ("fourcc", b'ATI2', 16, None),
+    0x5E: ("dx10", 95, 16, None),   # BC6H_UF16
+    0x5F: ("dx10", 98, 16, None),   # BC7_UNORM
+}
+# 纹理头中带有扩展数据的标志（flags最高字节）
+G1T_FLAG_EXTENDED = 0x10000000
+
+def mip_chain_size(width, height, mipmaps, fmt):
+    """整条mipmap链的数据大小"""
+    kind, _, unit, _ = G1T_FORMATS[fmt]
+    total = 0
+    for level in range(mipmaps):
+        w, h = max(width >> level, 1), max(height >> level, 1)
+        if kind == "rgba":
+            total += w * h * unit
+        else:
+            total += max((w + 3) // 4, 1) * max((h + 3) // 4, 1) * unit
+    return total
+
+def parse_g1t(data, base, size):
+    """解析 data[base:base+size] 处G1T的纹理表，返回每张纹理的信息字典列表
+
+    文件头：魔数、版本、总大小、偏移表位置、纹理数；偏移表中每项相对于偏移表起点。
+    纹理头8字节：mip数（高4位）、格式、宽高的log2（低/高4位）、标志，
+    标志含扩展位时随后是扩展数据（长度在前），其中可能给出非2的幂的实际宽高。
+    """
+    table_offset, count = struct.unpack_from('<II', data, base + 12)
+    table = base + table_offset
+    offsets = [table + offset for offset in struct.unpack_from(f'<{count}I', data, table)]
+    textures = []
+    for index, start in enumerate(offsets):
+        end = offsets[index + 1] if index + 1 < count else base + size
+        mip_byte, fmt, dims, _, flags = struct.unpack_from('<BBBBI', data, start)
+        width, height = 1 << (dims & 0x0F), 1 << (dims >> 4)
+        pos = start + 8
+        if flags & G1T_FLAG_EXTENDED:
+            extra_size = struct.unpack_from('<I', data, pos)[0]
+            if extra_size >= 0x14:
+                ext_width, ext_height = struct.unpack_from('<II', data, pos + 0x0C)
+                width, height = ext_width or width, ext_height or height
+            pos += extra_size
+        textures.append({"index": index, "format": fmt, "width": width, "height": height,
+                         "mipmaps": max(mip_byte >> 4, 1), "data_offset": pos, "data_size": end - pos})
+    return textures
+
+def dds_header(width, height, mipmaps, fmt):
+    """构造DDS文件头（BC6H/BC7附带DX10扩展头）"""
+    kind, code, unit, masks = G1T_FORMATS[fmt]
+    flags = 0x1 | 0x2 | 0x4 | 0x1000  # CAPS | HEIGHT | WIDTH | PIXELFORMAT
+    caps = 0x1000  # TEXTURE
+    if mipmaps > 1:
+        flags |= 0x20000  # MIPMAPCOUNT
+        caps |= 0x8 | 0x400000  # COMPLEX | MIPMAP
+
+    if kind == "rgba":
+        flags |= 0x8  # PITCH
+        pitch = width * unit
+        pixel_format = struct.pack('<II4sI4I', 32, 0x41, b'\x00' * 4, 32, *masks)
+    else:
+        flags |= 0x80000  # LINEARSIZE
+        pitch = max((width + 3) // 4, 1) * max((height + 3) // 4, 1) * unit
+        fourcc = b'DX10' if kind == "dx10" else code
+        pixel_format = struct.pack('<II4sI4I', 32, 0x4, fourcc, 0, 0, 0, 0, 0)
+
+    header = b'DDS ' + struct.pack('<7I44x', 124, flags, height, width, pitch, 0, mipmaps)
+    header += pixel_format + struct.pack('<5I', caps, 0, 0, 0, 0)
+    if kind == "dx10":
+        header += struct.pack('<5I', code, 3, 0, 1, 0)  # TEXTURE2D，数组大小1
+    return header
+
+def write_dds(view, output_path, header, offset, size):
+    with open(output_path, 'wb') as out_file:
+        out_file.write(header)
+        out_file.write(view[offset:offset + size])
+
+def pack_g1t_entries(data):
+    """按封包大小表找出其中的G1T条目，返回 (偏移, 有效大小) 列表"""
+    num_files = int.from_bytes(data[0:4], 'little')
+    header_size = 4 + 4 * num_files
+    if header_size > len(data):
+        raise ValueError("封包表超出文件范围")
+    offset = header_size + (16 - (header_size % 16)) % 16
+    entries = []
+    for size in struct.unpack_from(f'<{num_files}I', data, 4):
+        size *= 16
+        if size >= 16 and data[offset:offset + 4] == b'GT1G':
+            g1t_size = int.from_bytes(data[offset + 8:offset + 12], 'little')
+            entries.append((offset, min(g1t_size, size, len(data) - offset)))
+        offset += size
+    return entries
+
+def export_pack_dds(input_path, output_dir, verbose=False, jobs=0):
+    """从内存映射的封包中直接把每张G1T纹理写成DDS，纹理之间并行写出，不生成中间的.g1t文件"""
+    base_name = os.path.splitext(os.path.basename(input_path))[0]
+    try:
+        with open(input_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            tasks = []
+            for counter, (offset, size) in enumerate(pack_g1t_entries(mm), 1):
+                for texture in parse_g1t(mm, offset, size):
+                    name = f"{base_name}_{counter:04d}_{texture['index']:03d}.dds"
+                    fmt = texture["format"]
+                    if fmt not in G1T_FORMATS:
+                        print(f"跳过 {name}: 不支持的纹理格式 0x{fmt:02X}")
+                        continue
+                    # mip数据不足时只保留完整的级别
+                    mipmaps = texture["mipmaps"]
+                    while mipmaps > 1 and mip_chain_size(texture["width"], texture["height"], mipmaps, fmt) > texture["data_size"]:
+                        mipmaps -= 1
+                    data_size = min(mip_chain_size(texture["width"], texture["height"], mipmaps, fmt),
+                                    texture["data_size"])
+                    header = dds_header(texture["width"], texture["height"], mipmaps, fmt)
+                    tasks.append((name, header, texture["data_offset"], data_size))
+
+            with memoryview(mm) as view, ThreadPoolExecutor(max_workers=jobs or None) as pool:
+                futures = [pool.submit(write_dds, view, os.path.join(output_dir, name), header, offset, size)
+                           for name, header, offset, size in tasks]
+                for (name, *_), future in zip(tasks, futures):
+                    future.result()
+                    if verbose:
+                        print(f"从 {os.path.basename(input_path)} 导出 {name}")
+        return True
+    except Exception as e:
+        print(f"处理 {os.path.basename(input_path)} 失败: {str(e)}")
+        return False
+
+def timed_process(file_path, output_dir, verbose, progress, dds=False, jobs=0):
+    """处理单个文件并记录耗时与字节数"""
+    start = time.perf_counter()
+    ok = process_single_file(file_path, output_dir, verbose, dds, jobs)
+    progress.file_done(file_path, os.path.getsize(file_path), time.perf_counter() - start, ok)
+    return ok
+
+def batch_process(input_path, output_dir, verbose=False, progress=None, dds=False, jobs=0):
+    """批量处理入口"""
+    # 创建输出目录
+    os.makedirs(output_dir, exist_ok=True)
+    progress = progress or Progress("g1t")
+    
+    processed_files = 0
+    success_count = 0
+    
+    # 判断输入类型
+    if os.path.isfile(input_path):
+        # 处理单个文件
+        progress.add_total(1, os.path.getsize(input_path))
+        if timed_process(input_path, output_dir, verbose, progress, dds, jobs):
+            success_count += 1
+        processed_files += 1
+    elif os.path.isdir(input_path):
+        # 遍历目录下的所有文件
+        entries = [entry for entry in os.scandir(input_path) if entry.is_file()]
+        progress.add_total(len(entries), sum(entry.stat().st_size for entry in entries))
+        for entry in entries:
+            if timed_process(entry.path, output_dir, verbose, progress, dds, jobs):
+                success_count += 1
+            processed_files += 1
+    else:
+        raise ValueError("无效的输入路径")
+
+    progress.finish()
+    print(f"\n处理完成！成功处理 {success_count}/{processed_files} 个文件")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="G1T文件批量提取工具",
+        formatter_class=argparse.RawTextHelpFormatter
+    )
+    parser.add_argument("input", 
+                      help="输入文件或目录路径")
+    parser.add_argument("-o", "--output",
+                      default="extracted_g1t",
+                      help="输出目录（默认：extracted_g1t）")
+    parser.add_argument("-v", "--verbose",
+                      action="store_true",
+                      help="显示详细处理信息")
+    parser.add_argument("--dds",
+                      action="store_true",
+                      help="直接把G1T中的纹理导出为DDS，不写出中间的.g1t文件")
+    parser.add_argument("-j", "--jobs",
+                      type=int, default=0,
+                      help="DDS导出的并行线程数（默认：自动）")
+    telemetry.add_arguments(parser, quiet=False)
+    
+    args = parser.parse_args()
+
+    # 输入路径验证
+    if not os.path.exists(args.input):
+        print(f"错误：输入路径 '{args.input}' 不存在")
+        sys.exit(1)
+
+    print("\n" + "="*50)
+    print(f" 批量处理启动")
+    print(f" 输入路径: {args.input}")
+    print(f" 输出目录: {args.output}")
+    print("="*50)
+    
+    try:
+        batch_process(args.input, args.output, args.verbose,
+                      Progress("g1t", live=args.progress, jsonl_path=args.log_jsonl), args.dds, args.jobs)
+    except Exception as e:
+        print(f"\n[错误] {str(e)}")
         sys.exit(1)
\ No newline at end of file
@@ -1,357 +1,1745 @@
-import sys
-import struct
-import os
-import argparse
-from typing import BinaryIO, Dict, Tuple, List
-from pathlib import Path
-
-# -------------------------- 解压模块 --------------------------
-def decompress_lzp2(in_stream: BinaryIO, out_path):
-    # 原有解压代码保持不变
-    bytesIn = in_stream.read()
-    
-    magic = bytesIn[0:8]
-    original_size = struct.unpack('<I', bytesIn[8:12])[0]
-    compressed_size = struct.unpack('<I', bytesIn[12:16])[0]
-    
-    if magic != bytes.fromhex('4C5A5032AE47813F'):
-        raise ValueError("Invalid LZP2 file format")
-    
-    buffer = bytearray()
-    iterator = 0x10
-    gap = 0
-    
-    while iterator < len(bytesIn):
-        if gap == 0:
-            if iterator >= len(bytesIn):
-                break
-            current_byte = bytesIn[iterator]
-            
-            if current_byte & 0x80:
-                gap, iterator = handle_reference(iterator, buffer, bytesIn)
-            elif current_byte & 0x40:
-                gap, iterator = handle_rle(iterator, buffer, bytesIn)
-            else:
-                gap = current_byte
-                iterator += 1
-        else:
-            copy_len = min(gap, len(bytesIn) - iterator)
-            buffer.extend(bytesIn[iterator:iterator+copy_len])
-            iterator += copy_len
-            gap -= copy_len
-
-    with open(out_path, 'wb') as f:
-        f.write(buffer[:original_size])
-
-def handle_reference(iterator, buffer, bytesIn):
-    # 原有代码保持不变
-    if iterator + 1 >= len(bytesIn):
-        return 0, iterator
-    
-    cmd_byte = bytesIn[iterator]
-    offset_low = bytesIn[iterator+1]
-    
-    length = ((cmd_byte >> 3) & 0x0F) + 3
-    offset_high = cmd_byte & 0x07
-    offset = (offset_high << 8) | offset_low
-    offset += 1
-    
-    if offset > len(buffer):
-        raise ValueError("Invalid offset in compressed data")
-    
-    for _ in range(length):
-        buffer.append(buffer[-offset] if offset else buffer[-1])
-    
-    return 0, iterator + 2
-
-def handle_rle(iterator, buffer, bytesIn):
-    # 原有代码保持不变
-    if iterator + 2 >= len(bytesIn):
-        return 0, iterator
-    
-    cmd_byte = bytesIn[iterator]
-    count_low = bytesIn[iterator+1]
-    value = bytesIn[iterator+2]
-    
-    count = ((cmd_byte & 0x3F) << 8) | count_low
-    count += 4
-    
-    buffer.extend(bytes([value]) * count)
-    return 0, iterator + 3
-
-def decompress_lzp2_file(in_path, out_path):
-    # 原有代码保持不变
-    with open(in_path, 'rb') as in_file:
-        decompress_lzp2(in_file, out_path)
-
-# -------------------------- 压缩模块（最接近原始版本但修复问题） --------------------------
-def compress_lzp2(input_data: bytes) -> bytes:
-    compressed = bytearray()
-    compressed.extend(bytes.fromhex('4C5A5032AE47813F'))
-    original_size = len(input_data)
-    compressed.extend(struct.pack('<I', original_size))
-    compressed.extend(b'\x00' * 4)  # Placeholder for compressed size
-
-    output_buffer = bytearray()
-    hash_table: Dict[int, List[int]] = {}
-    pos = 0
-
-    while pos < len(input_data):
-        # 优先检测RLE
-        rle_len = get_rle_length(input_data, pos)
-        best_len, best_offset = find_best_match(output_buffer, input_data, pos, hash_table)
-        
-        # 选择RLE或引用中更优的 - 使用原始代码的逻辑
-        if rle_len >= 4 and rle_len >= best_len:
-            # RLE压缩
-            cmd = 0x40 | ((rle_len - 4) >> 8 & 0x3F)
-            low_byte = (rle_len - 4) & 0xFF
-            compressed.append(cmd)
-            compressed.append(low_byte)
-            compressed.append(input_data[pos])
-            # 批量更新哈希表
-            original_len = len(output_buffer)
-            output_buffer.extend([input_data[pos]] * rle_len)
-            update_hash_table_batch(output_buffer, hash_table, original_len, len(output_buffer))
-            pos += rle_len
-        elif best_len >= 3:
-            # 引用压缩 - 修复原始代码中的问题
-            offset_code = best_offset - 1
-            offset_high = (offset_code >> 8) & 0x07
-            offset_low = offset_code & 0xFF
-            incr = best_len - 3
-            cmd = 0x80 | (incr << 3) | offset_high
-            compressed.append(cmd)
-            compressed.append(offset_low)
-            # 批量更新哈希表 - 修复引用逻辑
-            original_len = len(output_buffer)
-            for i in range(best_len):
-                ref_pos = original_len - best_offset + i
-                if ref_pos < 0 or ref_pos >= original_len:
-                    # 如果引用位置无效，使用当前位置的数据
-                    output_buffer.append(input_data[pos + i])
-                else:
-                    output_buffer.append(output_buffer[ref_pos])
-            update_hash_table_batch(output_buffer, hash_table, original_len, len(output_buffer))
-            pos += best_len
-        else:
-            # 处理字面量 - 使用原始代码的贪心策略
-            max_literal_len = min(63, len(input_data) - pos)
-            literal_len = 1
-            while literal_len < max_literal_len:
-                next_pos = pos + literal_len
-                # 检查下一个位置是否有更好的压缩机会
-                if (get_rle_length(input_data, next_pos) >= 4 or 
-                    find_best_match(output_buffer, input_data, next_pos, hash_table)[0] >= 3):
-                    # 如果下一个位置有压缩机会，且当前字面量已经有一定长度，则停止
-                    if literal_len >= 1:
-                        break
-                literal_len += 1
-            
-            compressed.append(literal_len)
-            compressed.extend(input_data[pos:pos+literal_len])
-            original_len = len(output_buffer)
-            output_buffer.extend(input_data[pos:pos+literal_len])
-            update_hash_table_batch(output_buffer, hash_table, original_len, len(output_buffer))
-            pos += literal_len
-
-    # 更新压缩后大小并填充
-    data_size = len(compressed) - 16  # 排除文件头
-    padding = (16 - (data_size % 16)) % 16
-    total_data_size = data_size + padding
-    compressed[12:16] = struct.pack('<I', total_data_size)
-    compressed.extend(b'\x00' * padding)
-    
-    return bytes(compressed)
-
-def update_hash_table_batch(buffer: bytearray, hash_table: dict, start_pos: int, end_pos: int):
-    """批量更新哈希表，处理从start_pos到end_pos新增的三元组"""
-    for i in range(max(start_pos - 2, 0), end_pos - 2):
-        if i + 2 >= len(buffer):
-            continue
-        current_triple = buffer[i:i+3]
-        key = (current_triple[0] << 16) | (current_triple[1] << 8) | current_triple[2]
-        if key not in hash_table:
-            hash_table[key] = []
-        candidates = hash_table[key]
-        
-        # 添加新位置
-        candidates.append(i)
-        
-        # 清理旧的候选位置
-        # 只保留最近的位置，且偏移不超过2048
-        valid_candidates = []
-        for c in candidates:
-            if len(buffer) - c <= 2048:  # 偏移在窗口内
-                valid_candidates.append(c)
-        
-        # 保留最多100个最近的位置
-        if len(valid_candidates) > 100:
-            valid_candidates = valid_candidates[-100:]
-        
-        hash_table[key] = valid_candidates
-
-def get_rle_length(data: bytes, pos: int) -> int:
-    """获取RLE长度"""
-    if pos >= len(data):
-        return 0
-    
-    value = data[pos]
-    max_len = min(pos + 16387, len(data))
-    length = 1
-    
-    while pos + length < max_len and data[pos + length] == value:
-        length += 1
-    
-    return length if length >= 4 else 0
-
-def find_best_match(output_buffer: bytearray, input_data: bytes, pos: int, hash_table: dict) -> Tuple[int, int]:
-    """查找最佳匹配"""
-    max_offset = 2048
-    max_len = 18
-    
-    if pos + 2 >= len(input_data):
-        return 0, 0
-    
-    # 计算哈希键
-    current_triple = input_data[pos:pos+3]
-    key = (current_triple[0] << 16) | (current_triple[1] << 8) | current_triple[2]
-    
-    candidates = hash_table.get(key, [])
-    
-    best_len, best_offset = 0, 0
-    
-    # 检查最近的候选位置
-    for candidate in reversed(candidates[-100:]):  # 只检查最近的100个
-        if candidate >= len(output_buffer):
-            continue
-        
-        offset = len(output_buffer) - candidate
-        if offset > max_offset:
-            continue
-        
-        # 计算最大可能匹配长度
-        max_possible_len = min(max_len, len(input_data) - pos, len(output_buffer) - candidate)
-        
-        # 快速检查前3个字节
-        if candidate + 2 >= len(output_buffer):
-            continue
-        if output_buffer[candidate:candidate+3] != current_triple:
-            continue
-        
-        # 计算实际匹配长度
-        match_len = 3
-        while (match_len < max_possible_len and 
-               pos + match_len < len(input_data) and
-               candidate + match_len < len(output_buffer) and
-               input_data[pos + match_len] == output_buffer[candidate + match_len]):
-            match_len += 1
-        
-        # 更新最佳匹配
-        if match_len > best_len:
-            best_len = match_len
-            best_offset = offset
-            if best_len == max_len:
-                break
-    
-    return (best_len, best_offset) if best_len >= 3 else (0, 0)
-
-def compress_lzp2_file(input_path: str, output_path: str):
-    with open(input_path, 'rb') as f:
-        data = f.read()
-    compressed = compress_lzp2(data)
-    with open(output_path, 'wb') as f:
-        f.write(compressed)
-
-# -------------------------- 新参数解析逻辑 --------------------------
-def parse_arguments():
-    """使用argparse处理命令行参数"""
-    parser = argparse.ArgumentParser(
-        description="LZP2压缩工具 v2.1",
-        formatter_class=argparse.RawTextHelpFormatter
-    )
-    
-    # 模式选择
-    group = parser.add_mutually_exclusive_group(required=True)
-    group.add_argument("-c", "--compress", metavar=("INPUT", "OUTPUT"), nargs=2,
-                      help="单文件压缩模式\n示例: lzp2.py -c input.txt output.lzp2")
-    group.add_argument("-d", "--decompress", metavar=("INPUT", "OUTPUT"), nargs=2,
-                      help="单文件解压模式\n示例: lzp2.py -d input.lzp2 output.txt")
-    group.add_argument("-bc", "--batch-compress", metavar=("INPUTS", "OUTPUT_DIR"), nargs='+',
-                      help="批量压缩模式\n示例: lzp2.py -bc file1.txt file2.jpg output_dir/")
-    group.add_argument("-bd", "--batch-decompress", metavar=("INPUTS", "OUTPUT_DIR"), nargs='+',
-                      help="批量解压模式\n示例: lzp2.py -bd file1.lzp2 file2.lzp2 output_dir/")
-
-    return parser.parse_args()
-
-# -------------------------- 增强版批量处理 --------------------------
-def process_batch(mode: str, inputs: List[str], output_dir: str):
-    """处理批量模式"""
-    output_path = Path(output_dir)
-    output_path.mkdir(parents=True, exist_ok=True)
-    
-    processed = 0
-    for input_path in inputs:
-        input_file = Path(input_path)
-        
-        # 处理目录输入
-        if input_file.is_dir():
-            for root, _, files in os.walk(input_file):
-                for file in files:
-                    if mode == "d" and not file.endswith(".lzp2"):
-                        continue
-                    src = Path(root) / file
-                    process_single(mode, src, output_path)
-                    processed += 1
-        else:
-            process_single(mode, input_file, output_path)
-            processed += 1
-    
-    print(f"\n操作完成！成功处理 {processed} 个文件")
-
-def process_single(mode: str, input_file: Path, output_dir: Path):
-    """处理单个文件"""
-    try:
-        # 生成输出路径
-        if mode == "c":
-            output = output_dir / f"{input_file.name}.lzp2"
-            compress_lzp2_file(str(input_file), str(output))
-        elif mode == "d":
-            if input_file.suffix != ".lzp2":
-                return
-            output = output_dir / input_file.stem
-            decompress_lzp2_file(str(input_file), str(output))
-        
-        print(f"[✓] {input_file} -> {output.relative_to(output_dir)}")
-    except PermissionError:
-        print(f"[✗] 权限拒绝: {input_file}")
-    except Exception as e:
-        print(f"[✗] 处理失败 {input_file}: {str(e)}")
-
-# -------------------------- 主程序逻辑 --------------------------
-def main():
-    args = parse_arguments()
-    
-    # 单文件模式
-    if args.compress:
-        input_file, output_file = args.compress
-        compress_lzp2_file(input_file, output_file)
-        print(f"单文件压缩完成: {input_file} -> {output_file}")
-    
-    elif args.decompress:
-        input_file, output_file = args.decompress
-        decompress_lzp2_file(input_file, output_file)
-        print(f"单文件解压完成: {input_file} -> {output_file}")
-    
-    # 批量压缩模式
-    elif args.batch_compress:
-        *inputs, output_dir = args.batch_compress
-        process_batch("c", inputs, output_dir)
-    
-    # 批量解压模式
-    elif args.batch_decompress:
-        *inputs, output_dir = args.batch_decompress
-        process_batch("d", inputs, output_dir)
-
-if __name__ == "__main__":
-    main()
+import io
+import os
+import sys
+import asyncio
+import mmap
+import time
+import bisect
+import struct
+import shutil
+import re
+import csv
+import json
+import zlib
+import queue
+import fnmatch
+import hashlib
+import argparse
+import threading
+from array import array
+from collections import deque
+from typing import BinaryIO, Dict, Tuple, List
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+import telemetry
+from telemetry import Progress
+
+# DW4/DW5 使用的文件头魔数，以及无双大蛇Z版本的魔数
+LZP2_MAGIC = bytes.fromhex('4C5A5032AE47813F')
+OROCHI_Z_MAGIC = bytes.fromhex('4C5A50325C8F823F')
+KNOWN_MAGICS = {LZP2_MAGIC: "DW4/DW5", OROCHI_Z_MAGIC: "Orochi Z"}
+
+# -------------------------- 解压模块 --------------------------
+def decompress_lzp2(in_stream: BinaryIO, out_path):
+    # 原有解压代码保持不变
+    bytesIn = in_stream.read()
+    buffer = decompress_lzp2_data(bytesIn)
+
+    with open(out_path, 'wb') as f:
+        f.write(buffer)
+
+def decompress_lzp2_data(bytesIn: bytes, magic: bytes = LZP2_MAGIC) -> bytes:
+    """在内存中解压LZP2数据，返回解压后的字节（供流水线等调用）"""
+    original_size = struct.unpack('<I', bytesIn[8:12])[0]
+    compressed_size = struct.unpack('<I', bytesIn[12:16])[0]
+    
+    if bytesIn[0:8] != magic:
+        raise ValueError("Invalid LZP2 file format")
+    
+    buffer = bytearray()
+    iterator = 0x10
+    gap = 0
+    
+    while iterator < len(bytesIn):
+        if gap == 0:
+            if iterator >= len(bytesIn):
+                break
+            current_byte = bytesIn[iterator]
+            
+            if current_byte & 0x80:
+                gap, iterator = handle_reference(iterator, buffer, bytesIn)
+            elif current_byte & 0x40:
+                gap, iterator = handle_rle(iterator, buffer, bytesIn)
+            else:
+                gap = current_byte
+                iterator += 1
+        else:
+            copy_len = min(gap, len(bytesIn) - iterator)
+            buffer.extend(bytesIn[iterator:iterator+copy_len])
+            iterator += copy_len
+            gap -= copy_len
+
+    return bytes(buffer[:original_size])
+
+def handle_reference(iterator, buffer, bytesIn):
+    # 原有代码保持不变
+    if iterator + 1 >= len(bytesIn):
+        return 0, iterator
+    
+    cmd_byte = bytesIn[iterator]
+    offset_low = bytesIn[iterator+1]
+    
+    length = ((cmd_byte >> 3) & 0x0F) + 3
+    offset_high = cmd_byte & 0x07
+    offset = (offset_high << 8) | offset_low
+    offset += 1
+    
+    if offset > len(buffer):
+        raise ValueError("Invalid offset in compressed data")
+    
+    for _ in range(length):
+        buffer.append(buffer[-offset] if offset else buffer[-1])
+    
+    return 0, iterator + 2
+
+def handle_rle(iterator, buffer, bytesIn):
+    # 原有代码保持不变
+    if iterator + 2 >= len(bytesIn):
+        return 0, iterator
+    
+    cmd_byte = bytesIn[iterator]
+    count_low = bytesIn[iterator+1]
+    value = bytesIn[iterator+2]
+    
+    count = ((cmd_byte & 0x3F) << 8) | count_low
+    count += 4
+    
+    buffer.extend(bytes([value]) * count)
+    return 0, iterator + 3
+
+def decompress_lzp2_file(in_path, out_path):
+    # 原有代码保持不变
+    with open(in_path, 'rb') as in_file:
+        decompress_lzp2(in_file, out_path)
+
+# -------------------------- 随机访问模块 --------------------------
+# 引用最远只回溯2048字节，因此检查点只需保存最近2048字节的历史窗口
+HISTORY_SIZE = 2048
+INDEX_MAGIC = b'LZPI'
+INDEX_VERSION = 3
+# 索引头：魔数、版本、间隔、检查点数，以及所索引文件的原始大小、压缩大小、文件大小、
+# 修改时间和文件头+末尾数据的CRC32（只读少量数据，打开文件时不必读完整个文件）
+INDEX_HEADER = struct.Struct('<4sIIIIIIQI')
+INDEX_ENTRY = struct.Struct('<IIIH')
+INDEX_TAIL_SIZE = 64 * 1024
+DEFAULT_INDEX_INTERVAL = 64 * 1024
+# 顺序解码时历史缓冲区超过该大小就丢弃已读过的部分
+READER_TRIM_SIZE = 1 << 20
+
+class LZP2Reader(io.RawIOBase):
+    """支持seek()的LZP2只读文件对象
+
+    有检查点索引时，随机读取会从目标位置之前最近的检查点恢复解码状态
+    （输入位置、未读完的字面量长度、2 KiB历史窗口），代价为O(索引间隔)而不是O(文件大小)。
+    """
+
+    def __init__(self, source, checkpoints: List[Tuple[int, int, int, bytes]] = None,
+                 magic: bytes = None):
+        super().__init__()
+        self._file = None
+        if isinstance(source, (bytes, bytearray, memoryview, mmap.mmap)):
+            self._data = source
+        else:
+            self._file = open(source, 'rb')
+            self._data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        # 未指定魔数时按文件头识别 KNOWN_MAGICS 中的任一格式
+        if len(self._data) < 16 or (self._data[0:8] != magic if magic else self._data[0:8] not in KNOWN_MAGICS):
+            raise ValueError("Invalid LZP2 file format")
+        self.size = struct.unpack('<I', self._data[8:12])[0]
+
+        self._pos = 0
+        self.set_checkpoints(checkpoints)
+
+    def set_checkpoints(self, checkpoints: List[Tuple[int, int, int, bytes]] = None):
+        """设置（或清除）检查点索引，并回到文件开头的解码状态"""
+        self._checkpoints = checkpoints or [(0, 0x10, 0, b'')]
+        self._checkpoint_offsets = [cp[0] for cp in self._checkpoints]
+        self._restore(self._checkpoints[0])
+
+    def _restore(self, checkpoint):
+        out_pos, in_pos, gap, history = checkpoint
+        self._buf = bytearray(history)
+        self._base = out_pos - len(history)
+        self._in = in_pos
+        self._gap = gap
+
+    def _decode_until(self, target: int, interval: int = 0, checkpoints: list = None):
+        """从当前状态继续解码直到输出达到target；interval>0时每隔interval字节记录一个检查点"""
+        bytesIn = self._data
+        buf = self._buf
+        next_checkpoint = (self._base + len(buf)) // interval * interval + interval if interval else None
+
+        while self._base + len(buf) < target and self._in < len(bytesIn):
+            out_pos = self._base + len(buf)
+            if next_checkpoint is not None and out_pos >= next_checkpoint:
+                checkpoints.append((out_pos, self._in, self._gap, bytes(buf[-HISTORY_SIZE:])))
+                next_checkpoint = out_pos // interval * interval + interval
+
+            if self._gap == 0:
+                current_byte = bytesIn[self._in]
+                if current_byte & 0x80:
+                    _, iterator = handle_reference(self._in, buf, bytesIn)
+                elif current_byte & 0x40:
+                    _, iterator = handle_rle(self._in, buf, bytesIn)
+                else:
+                    self._gap = current_byte
+                    iterator = self._in + 1
+                if iterator == self._in:
+                    break  # 数据被截断
+                self._in = iterator
+            else:
+                copy_len = min(self._gap, len(bytesIn) - self._in)
+                if next_checkpoint is not None:
+                    # 字面量跨越检查点时拆开，使检查点落在准确位置
+                    copy_len = min(copy_len, next_checkpoint - out_pos)
+                buf.extend(bytesIn[self._in:self._in + copy_len])
+                self._in += copy_len
+                self._gap -= copy_len
+
+            # 丢弃不再需要的旧数据，保留历史窗口和当前读取位置之后的内容
+            drop = min(len(buf) - HISTORY_SIZE, self._pos - self._base)
+            if drop > READER_TRIM_SIZE and checkpoints is None:
+                del buf[:drop]
+                self._base += drop
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._pos
+        elif whence == io.SEEK_END:
+            offset += self.size
+        if offset < 0:
+            raise ValueError("negative seek position")
+        self._pos = offset
+        return self._pos
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = self.size - self._pos
+        end = min(self._pos + size, self.size)
+        if end <= self._pos:
+            return b''
+
+        # 目标位置不在当前缓冲区内时，决定是继续顺序解码还是跳到检查点
+        decoded_end = self._base + len(self._buf)
+        if self._pos < self._base or self._pos > decoded_end:
+            checkpoint = self._checkpoints[bisect.bisect_right(self._checkpoint_offsets, self._pos) - 1]
+            if self._pos < self._base or checkpoint[0] > decoded_end:
+                self._restore(checkpoint)
+
+        self._decode_until(end)
+        data = bytes(self._buf[self._pos - self._base:end - self._base])
+        self._pos += len(data)
+        return data
+
+    def readinto(self, b):
+        data = self.read(len(b))
+        b[:len(data)] = data
+        return len(data)
+
+    def close(self):
+        if self._file is not None:
+            self._data.close()
+            self._file.close()
+            self._file = None
+        super().close()
+
+def build_lzp2_index(bytesIn, interval: int = DEFAULT_INDEX_INTERVAL,
+                     magic: bytes = None) -> List[Tuple[int, int, int, bytes]]:
+    """完整解码一遍，每隔interval字节输出记录一个检查点"""
+    reader = LZP2Reader(bytesIn, magic=magic)
+    checkpoints = [(0, 0x10, 0, b'')]
+    reader._decode_until(reader.size, interval, checkpoints)
+    return checkpoints
+
+def index_source_fields(path) -> Tuple[int, int, int, int, int]:
+    """索引所对应LZP2文件的 (原始大小, 压缩大小, 文件大小, 修改时间, 头尾CRC32)
+
+    只stat并读取16字节文件头和最后64 KiB，用于识别文件被重写后的过期索引，代价与文件大小无关。
+    """
+    with open(path, 'rb') as f:
+        st = os.fstat(f.fileno())
+        header = f.read(16)
+        f.seek(max(st.st_size - INDEX_TAIL_SIZE, len(header)))
+        tail = f.read()
+    original_size, compressed_size = struct.unpack('<II', header[8:16]) if len(header) == 16 else (0, 0)
+    return original_size, compressed_size, st.st_size, st.st_mtime_ns, zlib.crc32(tail, zlib.crc32(header))
+
+def write_lzp2_index(index_path, checkpoints, source_path, interval: int = DEFAULT_INDEX_INTERVAL):
+    """写出检查点索引（边车文件），source_path为被索引的LZP2文件"""
+    with open(index_path, 'wb') as f:
+        f.write(INDEX_HEADER.pack(INDEX_MAGIC, INDEX_VERSION, interval, len(checkpoints),
+                                  *index_source_fields(source_path)))
+        for out_pos, in_pos, gap, history in checkpoints:
+            f.write(INDEX_ENTRY.pack(out_pos, in_pos, gap, len(history)))
+            f.write(history)
+
+def read_lzp2_index(index_path, source_path=None) -> List[Tuple[int, int, int, bytes]]:
+    """读取检查点索引；给出source_path时校验索引确实属于该文件
+
+    索引不匹配、版本不符、被截断或损坏时抛出ValueError，调用方可退回从头解码。
+    """
+    with open(index_path, 'rb') as f:
+        data = f.read()
+    if len(data) < 8 or data[0:4] != INDEX_MAGIC:
+        raise ValueError("Invalid LZP2 index file")
+    version = struct.unpack('<I', data[4:8])[0]
+    if version != INDEX_VERSION:
+        raise ValueError(f"Unsupported LZP2 index version {version}")
+    if len(data) < INDEX_HEADER.size:
+        raise ValueError("Truncated LZP2 index header")
+    _, _, interval, count, *source_fields = INDEX_HEADER.unpack_from(data)
+    if source_path is not None and tuple(source_fields) != index_source_fields(source_path):
+        raise ValueError("LZP2 index does not match the file (stale index)")
+
+    checkpoints = []
+    pos = INDEX_HEADER.size
+    for _ in range(count):
+        if pos + INDEX_ENTRY.size > len(data):
+            raise ValueError("Truncated LZP2 index entry")
+        out_pos, in_pos, gap, history_len = INDEX_ENTRY.unpack_from(data, pos)
+        pos += INDEX_ENTRY.size
+        if history_len > HISTORY_SIZE or pos + history_len > len(data):
+            raise ValueError("Corrupt LZP2 index entry")
+        checkpoints.append((out_pos, in_pos, gap, data[pos:pos + history_len]))
+        pos += history_len
+    return checkpoints
+
+def open_lzp2(path, index_path=None) -> LZP2Reader:
+    """打开LZP2文件用于随机读取，存在边车索引（默认 path + '.idx'）时自动使用
+
+    索引记录了所属文件的大小、修改时间和头尾CRC32，文件被重写后索引过期；
+    索引过期、截断或损坏时忽略索引并从头解码。
+    """
+    reader = LZP2Reader(path)
+    index_path = index_path or f"{path}.idx"
+    if os.path.exists(index_path):
+        try:
+            checkpoints = read_lzp2_index(index_path, path)
+        except ValueError as e:
+            print(f"[!] 忽略索引 {index_path}: {str(e)}", file=sys.stderr)
+        else:
+            reader.set_checkpoints(checkpoints)
+    return reader
+
+# -------------------------- 压缩模块（最接近原始版本但修复问题） --------------------------
+# 压缩等级 -> 每个三元组保留/检查的候选位置数，等级越高越慢、压缩率越好
+COMPRESSION_LEVELS = {1: 4, 2: 16, 3: 100}
+DEFAULT_LEVEL = 3
+# 超出大小限制时依次尝试的等级，最后使用 lzp2_ultra_compression_ratio 的全窗口搜索
+ESCALATION_ORDER = [1, 2, 3, "ultra"]
+
+# 候选位置的计算方式：安装了NumPy时一次性预计算三元组链表，否则逐字节维护哈希表，两者输出相同
+CANDIDATE_BACKEND = "numpy" if np is not None else "python"
+
+class BudgetExceeded(ValueError):
+    """压缩输出超过允许的最大大小（例如封包中原文件的槽位）"""
+
+def compress_lzp2(input_data: bytes, level: int = DEFAULT_LEVEL, max_size: int = None) -> bytes:
+    """压缩为LZP2格式；max_size给定时（含16字节文件头），一旦输出超出立即抛出BudgetExceeded"""
+    compressed = bytearray()
+    compressed.extend(LZP2_MAGIC)
+    original_size = len(input_data)
+    compressed.extend(struct.pack('<I', original_size))
+    compressed.extend(b'\x00' * 4)  # Placeholder for compressed size
+
+    compressed.extend(compress_tokens(input_data, 0, level, None if max_size is None else max_size - 16))
+
+    # 更新压缩后大小并填充
+    data_size = len(compressed) - 16  # 排除文件头
+    padding = (16 - (data_size % 16)) % 16
+    total_data_size = data_size + padding
+    compressed[12:16] = struct.pack('<I', total_data_size)
+    compressed.extend(b'\x00' * padding)
+    if max_size is not None and len(compressed) > max_size:
+        raise BudgetExceeded(f"压缩输出 {len(compressed)} 字节，超过 {max_size} 字节")
+    
+    return bytes(compressed)
+
+def compress_tokens(input_data: bytes, start: int = 0, level: int = DEFAULT_LEVEL,
+                    max_size: int = None) -> bytearray:
+    """把 input_data[start:] 编码为LZP2命令流（不含文件头和填充）
+
+    input_data[:start] 作为已输出的历史预先放入窗口和哈希表，供采样估算等场景
+    从文件中间开始编码；start为0时与完整压缩完全一致。max_size限制命令流本身的大小。
+    """
+    return encode_tokens(input_data, start, level, max_size)[0]
+
+def encode_tokens(input_data: bytes, start: int = 0, level: int = DEFAULT_LEVEL, max_size: int = None,
+                  stop_at=None, backend: str = None) -> Tuple[bytearray, int]:
+    """compress_tokens 的实现，返回 (命令流, 结束位置)
+
+    stop_at为位置集合时，编码到达其中任一位置（命令边界）即停止，供增量压缩在重新同步处截断。
+    backend可指定 "python" 或 "numpy"，默认使用 CANDIDATE_BACKEND。
+    """
+    if (backend or CANDIDATE_BACKEND) == "numpy":
+        return encode_tokens_chain(input_data, start, level, max_size, stop_at)
+    max_candidates = COMPRESSION_LEVELS[level]
+    compressed = bytearray()
+    output_buffer = bytearray(input_data[:start])
+    hash_table: Dict[int, List[int]] = {}
+    # 只有最后2 KiB历史中的位置可能被引用
+    update_hash_table_batch(output_buffer, hash_table, max(start - HISTORY_SIZE, 0), start, max_candidates)
+    rle_table = build_rle_table(input_data)
+    pos = start
+
+    while pos < len(input_data):
+        if stop_at is not None and pos in stop_at:
+            break
+        # 超出预算时提前终止，不必等到整个文件压缩完
+        if max_size is not None and len(compressed) > max_size:
+            raise BudgetExceeded(f"压缩输出超过 {max_size + 16} 字节（已处理 {pos}/{len(input_data)} 字节）")
+
+        # 优先检测RLE
+        rle_len = rle_table[pos]
+        best_len, best_offset = find_best_match(output_buffer, input_data, pos, hash_table, max_candidates)
+        
+        # 选择RLE或引用中更优的 - 使用原始代码的逻辑
+        if rle_len >= 4 and rle_len >= best_len:
+            # RLE压缩
+            cmd = 0x40 | ((rle_len - 4) >> 8 & 0x3F)
+            low_byte = (rle_len - 4) & 0xFF
+            compressed.append(cmd)
+            compressed.append(low_byte)
+            compressed.append(input_data[pos])
+            # 批量更新哈希表
+            original_len = len(output_buffer)
+            output_buffer.extend([input_data[pos]] * rle_len)
+            update_hash_table_batch(output_buffer, hash_table, original_len, len(output_buffer), max_candidates)
+            pos += rle_len
+        elif best_len >= 3:
+            # 引用压缩 - 修复原始代码中的问题
+            offset_code = best_offset - 1
+            offset_high = (offset_code >> 8) & 0x07
+            offset_low = offset_code & 0xFF
+            incr = best_len - 3
+            cmd = 0x80 | (incr << 3) | offset_high
+            compressed.append(cmd)
+            compressed.append(offset_low)
+            # 批量更新哈希表 - 修复引用逻辑
+            original_len = len(output_buffer)
+            for i in range(best_len):
+                ref_pos = original_len - best_offset + i
+                if ref_pos < 0 or ref_pos >= original_len:
+                    # 如果引用位置无效，使用当前位置的数据
+                    output_buffer.append(input_data[pos + i])
+                else:
+                    output_buffer.append(output_buffer[ref_pos])
+            update_hash_table_batch(output_buffer, hash_table, original_len, len(output_buffer), max_candidates)
+            pos += best_len
+        else:
+            # 处理字面量 - 使用原始代码的贪心策略
+            max_literal_len = min(63, len(input_data) - pos)
+            literal_len = 1
+            while literal_len < max_literal_len:
+                next_pos = pos + literal_len
+                # 检查下一个位置是否有更好的压缩机会
+                if (rle_table[next_pos] >= 4 or 
+                    find_best_match(output_buffer, input_data, next_pos, hash_table, max_candidates)[0] >= 3):
+                    # 如果下一个位置有压缩机会，且当前字面量已经有一定长度，则停止
+                    if literal_len >= 1:
+                        break
+                literal_len += 1
+            
+            compressed.append(literal_len)
+            compressed.extend(input_data[pos:pos+literal_len])
+            original_len = len(output_buffer)
+            output_buffer.extend(input_data[pos:pos+literal_len])
+            update_hash_table_batch(output_buffer, hash_table, original_len, len(output_buffer), max_candidates)
+            pos += literal_len
+
+    return compressed, pos
+
+# -------------------------- NumPy候选预计算 --------------------------
+# 分段计算链表时相邻段的重叠字节数，需覆盖2 KiB窗口加字面量前瞻
+CHAIN_SEGMENT_SIZE = 1 << 20
+CHAIN_OVERLAP = 4096
+
+def build_prev_chain(input_data: bytes) -> array:
+    """用NumPy计算每个位置三元组键的上一次出现位置（没有时为-1）
+
+    按段对键做稳定排序，排序后相邻且键相同的两项即为同一键的前后两次出现。
+    只有距离在2 KiB窗口附近的链接会被使用，因此分段（带重叠）计算即可，临时内存与段大小成正比。
+    """
+    count = len(input_data) - 2
+    chain = array('i', bytes(4 * max(count, 0)))
+    for seg_start in range(0, max(count, 0), CHAIN_SEGMENT_SIZE):
+        lo = max(seg_start - CHAIN_OVERLAP, 0)
+        hi = min(seg_start + CHAIN_SEGMENT_SIZE, count)
+        data = np.frombuffer(input_data, dtype=np.uint8, count=hi + 2 - lo, offset=lo).astype(np.int32)
+        keys = (data[:-2] << 16) | (data[1:-1] << 8) | data[2:]
+        order = np.argsort(keys, kind='stable').astype(np.int32)
+        same = keys[order[1:]] == keys[order[:-1]]
+        prev = np.full(len(keys), -1 - lo, dtype=np.int32)
+        prev[order[1:][same]] = order[:-1][same]
+        prev += lo
+        chain[seg_start:hi] = array('i', prev[seg_start - lo:].tobytes())
+    return chain
+
+def find_chain_match(input_data: bytes, pos: int, end: int, chain: array,
+                     max_candidates: int = 100) -> Tuple[int, int]:
+    """与 find_best_match(input_data[:end], input_data, pos, ...) 等价，候选沿链表从近到远遍历
+
+    哈希表中只有三元组已完整输出（位置 <= end-3）且偏移不超过2048的位置，
+    链表上更近的位置先跳过，再最多检查max_candidates个窗口内的位置。
+    """
+    if pos + 2 >= len(input_data):
+        return 0, 0
+    candidate = chain[pos]
+    while candidate >= 0 and candidate > end - 3:
+        candidate = chain[candidate]
+
+    best_len, best_offset = 0, 0
+    window_start = max(end - 2048, 0)
+    limit = min(18, len(input_data) - pos)
+    checked = 0
+    while candidate >= window_start and checked < max_candidates:
+        checked += 1
+        max_possible_len = min(limit, end - candidate)
+        match_len = 3
+        while match_len < max_possible_len and input_data[pos + match_len] == input_data[candidate + match_len]:
+            match_len += 1
+        if match_len > best_len:
+            best_len = match_len
+            best_offset = end - candidate
+            if best_len == 18:
+                break
+        candidate = chain[candidate]
+
+    return (best_len, best_offset) if best_len >= 3 else (0, 0)
+
+def encode_tokens_chain(input_data: bytes, start: int = 0, level: int = DEFAULT_LEVEL, max_size: int = None,
+                        stop_at=None) -> Tuple[bytearray, int]:
+    """encode_tokens 的NumPy后端：候选来自预计算的链表，不再逐字节维护哈希表和输出缓冲
+
+    输出缓冲总是等于 input_data[:pos]，因此直接在输入上比较；解析策略与纯Python版本完全一致。
+    """
+    max_candidates = COMPRESSION_LEVELS[level]
+    compressed = bytearray()
+    chain = build_prev_chain(input_data)
+    rle_table = build_rle_table(input_data)
+    size = len(input_data)
+    pos = start
+
+    while pos < size:
+        if stop_at is not None and pos in stop_at:
+            break
+        if max_size is not None and len(compressed) > max_size:
+            raise BudgetExceeded(f"压缩输出超过 {max_size + 16} 字节（已处理 {pos}/{size} 字节）")
+
+        rle_len = rle_table[pos]
+        best_len, best_offset = find_chain_match(input_data, pos, pos, chain, max_candidates)
+
+        if rle_len >= 4 and rle_len >= best_len:
+            compressed.append(0x40 | ((rle_len - 4) >> 8 & 0x3F))
+            compressed.append((rle_len - 4) & 0xFF)
+            compressed.append(input_data[pos])
+            pos += rle_len
+        elif best_len >= 3:
+            offset_code = best_offset - 1
+            compressed.append(0x80 | ((best_len - 3) << 3) | ((offset_code >> 8) & 0x07))
+            compressed.append(offset_code & 0xFF)
+            pos += best_len
+        else:
+            max_literal_len = min(63, size - pos)
+            literal_len = 1
+            while literal_len < max_literal_len:
+                next_pos = pos + literal_len
+                # 窗口终点仍是pos：下一位置只要在窗口内有同键位置即可构成匹配
+                if rle_table[next_pos] >= 4 or (next_pos + 2 < size and
+                                                find_chain_match(input_data, next_pos, pos, chain, 1)[0] >= 3):
+                    break
+                literal_len += 1
+
+            compressed.append(literal_len)
+            compressed.extend(input_data[pos:pos + literal_len])
+            pos += literal_len
+
+    return compressed, pos
+
+def compress_lzp2_ultra(input_data: bytes, max_size: int = None) -> bytes:
+    """使用 lzp2_ultra_compression_ratio 的全窗口搜索压缩（最慢，压缩率最高）"""
+    from lzp2_ultra_compression_ratio import LZP2Compressor, create_lzp2_header
+
+    body_budget = None if max_size is None else max_size - 16
+    body = LZP2Compressor().compress(input_data, body_budget)
+    if body is None:
+        raise BudgetExceeded(f"压缩输出超过 {max_size} 字节")
+    return create_lzp2_header(len(input_data), len(body)) + body
+
+def compress_to_fit(input_data: bytes, max_size: int) -> Tuple[bytes, object]:
+    """按 ESCALATION_ORDER 从快到慢逐级尝试，返回第一个不超过max_size的结果及所用等级"""
+    for level in ESCALATION_ORDER:
+        try:
+            if level == "ultra":
+                return compress_lzp2_ultra(input_data, max_size), level
+            return compress_lzp2(input_data, level, max_size), level
+        except BudgetExceeded:
+            continue
+    raise BudgetExceeded(f"所有压缩等级的输出均超过 {max_size} 字节")
+
+def update_hash_table_batch(buffer: bytearray, hash_table: dict, start_pos: int, end_pos: int,
+                            max_candidates: int = 100):
+    """批量更新哈希表，处理从start_pos到end_pos新增的三元组
+
+    调用时buffer已扩展完毕，窗口下限在整批内不变，因此先按键收集新位置，
+    再对每个键只做一次过滤和截断（结果与逐个插入相同），长RLE段不再对同一个键反复重建列表。
+    """
+    new_positions: Dict[int, List[int]] = {}
+    for i in range(max(start_pos - 2, 0), end_pos - 2):
+        key = (buffer[i] << 16) | (buffer[i + 1] << 8) | buffer[i + 2]
+        positions = new_positions.get(key)
+        if positions is None:
+            new_positions[key] = [i]
+        else:
+            positions.append(i)
+
+    # 只保留偏移不超过2048的位置，且最多max_candidates个最近的位置
+    window_start = len(buffer) - 2048
+    for key, positions in new_positions.items():
+        candidates = hash_table.get(key)
+        candidates = candidates + positions if candidates else positions
+        if candidates[0] < window_start:
+            candidates = candidates[bisect.bisect_left(candidates, window_start):]
+        hash_table[key] = candidates[-max_candidates:]
+
+# 至少4个相同字节才能编码为RLE，单条RLE最多16387字节
+RLE_MIN_LENGTH = 4
+RLE_MAX_LENGTH = 16387
+_RUN_PATTERN = re.compile(rb'(.)\1{%d,}' % (RLE_MIN_LENGTH - 1), re.S)
+
+def build_rle_table(data: bytes) -> array:
+    """一次性计算每个位置的RLE长度表：table[pos] 为从pos开始的连续相同字节数（最多RLE_MAX_LENGTH，不足4时为0）
+
+    由正则在C层面找出所有长度>=4的连续段，只为这些段填充递减的剩余长度，
+    其余位置保持为0，长段不再在每个位置被重复扫描。
+    """
+    table = array('H', bytes(2 * len(data)))
+    for run in _RUN_PATTERN.finditer(data):
+        start, length = run.start(), run.end() - run.start()
+        if length <= RLE_MAX_LENGTH:
+            values = array('H', range(length, RLE_MIN_LENGTH - 1, -1))
+        else:
+            values = array('H', [RLE_MAX_LENGTH]) * (length - RLE_MAX_LENGTH)
+            values.extend(range(RLE_MAX_LENGTH, RLE_MIN_LENGTH - 1, -1))
+        table[start:start + len(values)] = values
+    return table
+
+def find_best_match(output_buffer: bytearray, input_data: bytes, pos: int, hash_table: dict,
+                    max_candidates: int = 100) -> Tuple[int, int]:
+    """查找最佳匹配"""
+    max_offset = 2048
+    max_len = 18
+    
+    if pos + 2 >= len(input_data):
+        return 0, 0
+    
+    # 计算哈希键
+    current_triple = input_data[pos:pos+3]
+    key = (current_triple[0] << 16) | (current_triple[1] << 8) | current_triple[2]
+    
+    candidates = hash_table.get(key, [])
+    
+    best_len, best_offset = 0, 0
+    
+    # 检查最近的候选位置
+    for candidate in reversed(candidates[-max_candidates:]):  # 只检查最近的max_candidates个
+        if candidate >= len(output_buffer):
+            continue
+        
+        offset = len(output_buffer) - candidate
+        if offset > max_offset:
+            continue
+        
+        # 计算最大可能匹配长度
+        max_possible_len = min(max_len, len(input_data) - pos, len(output_buffer) - candidate)
+        
+        # 快速检查前3个字节
+        if candidate + 2 >= len(output_buffer):
+            continue
+        if output_buffer[candidate:candidate+3] != current_triple:
+            continue
+        
+        # 计算实际匹配长度
+        match_len = 3
+        while (match_len < max_possible_len and 
+               pos + match_len < len(input_data) and
+               candidate + match_len < len(output_buffer) and
+               input_data[pos + match_len] == output_buffer[candidate + match_len]):
+            match_len += 1
+        
+        # 更新最佳匹配
+        if match_len > best_len:
+            best_len = match_len
+            best_offset = offset
+            if best_len == max_len:
+                break
+    
+    return (best_len, best_offset) if best_len >= 3 else (0, 0)
+
+def compress_lzp2_file(input_path: str, output_path: str, level: int = DEFAULT_LEVEL, max_size: int = None):
+    """压缩单个文件；给定max_size时自动升级压缩等级直到结果能放入槽位，返回所用等级"""
+    with open(input_path, 'rb') as f:
+        if max_size is None:
+            # 无大小限制时流式压缩，内存占用与文件大小无关
+            compress_lzp2_stream(f, output_path, level)
+            return level
+        data = f.read()
+    compressed, level = compress_to_fit(data, max_size)
+    with open(output_path, 'wb') as f:
+        f.write(compressed)
+    return level
+
+# -------------------------- 压缩大小估算 --------------------------
+# 采样块大小与采样比例：每块前面带上2 KiB历史一起编码，只统计块本身产生的命令字节。
+# 采样量按输入大小的固定比例计算，块大小按目标块数缩小（不低于下限）；
+# 每块都要预热2 KiB历史，小文件的块数降到ESTIMATE_MIN_BLOCKS以控制这部分开销
+ESTIMATE_BLOCK_SIZE = 4096
+ESTIMATE_MIN_BLOCK_SIZE = 256
+ESTIMATE_SAMPLE_RATIO = 1 / 32
+ESTIMATE_TARGET_BLOCKS = 16
+ESTIMATE_MIN_BLOCKS = 8
+# 不超过该大小的文件采样也快不了多少，直接完整压缩给出精确值
+ESTIMATE_EXACT_SIZE = 32 * 1024
+# 误差界使用的置信系数（约95%）
+ESTIMATE_Z = 1.96
+
+def t_quantile(df: int, z: float = ESTIMATE_Z) -> float:
+    """自由度为df的t分布分位数（Cornish-Fisher展开近似，df>=7时误差<0.01），块数少时放宽误差界"""
+    return z + (z ** 3 + z) / (4 * df) + (5 * z ** 5 + 16 * z ** 3 + 3 * z) / (96 * df ** 2)
+
+def estimate_lzp2_size(input_data: bytes, level: int = DEFAULT_LEVEL,
+                       block_size: int = ESTIMATE_BLOCK_SIZE,
+                       sample_ratio: float = ESTIMATE_SAMPLE_RATIO) -> Tuple[int, int]:
+    """估算 compress_lzp2 的输出大小（含文件头与填充），返回 (估算大小, 误差界)
+
+    把文件分成等大的若干层，每层中间取一个块，连同前面2 KiB历史用真实编码器编码，
+    按各块压缩率的均值外推整个文件；误差界取约95%置信区间（含有限总体修正）。
+    采样量为文件大小的sample_ratio，块数不足ESTIMATE_TARGET_BLOCKS时缩小块（不低于下限）。
+    小文件或采样量不小于整个文件时直接完整编码，误差界为0，表示结果是精确值。
+    """
+    total = len(input_data)
+    sample = int(total * sample_ratio)
+    block_size = max(ESTIMATE_MIN_BLOCK_SIZE, min(block_size, sample // ESTIMATE_TARGET_BLOCKS))
+    blocks = max(ESTIMATE_MIN_BLOCKS, sample // block_size)
+    if total <= ESTIMATE_EXACT_SIZE or blocks * block_size >= total:
+        return len(compress_lzp2(input_data, level)), 0
+
+    stride = total / blocks
+    ratios = []
+    for index in range(blocks):
+        start = int(index * stride + (stride - block_size) / 2)
+        history = min(start, HISTORY_SIZE)
+        window = input_data[start - history:start + block_size]
+        ratios.append(len(compress_tokens(window, history, level)) / block_size)
+
+    mean = sum(ratios) / blocks
+    variance = sum((ratio - mean) ** 2 for ratio in ratios) / (blocks - 1)
+    sampled = blocks * block_size
+    error = t_quantile(blocks - 1) * (variance / blocks * (1 - sampled / total)) ** 0.5
+
+    body = mean * total
+    estimate = 16 + (int(round(body)) + 15) // 16 * 16
+    # 加上填充带来的最多15字节不确定性，并按16字节向上取整
+    bound = (int(error * total) + 15 + 15) // 16 * 16
+    return estimate, bound
+
+def estimate_fit(estimate: int, bound: int, max_size: int) -> str:
+    """根据估算区间判断能否放入槽位：fits / overflows / uncertain"""
+    if estimate + bound <= max_size:
+        return "fits"
+    if estimate - bound > max_size:
+        return "overflows"
+    return "uncertain"
+
+# -------------------------- 流式压缩 --------------------------
+# 每次编码的数据量，以及为RLE（最长16387字节）、字面量前瞻和匹配长度保留的前瞻字节数
+WRITER_CHUNK_SIZE = 64 * 1024
+WRITER_LOOKAHEAD = RLE_MAX_LENGTH + 128
+
+class LZP2Writer(io.RawIOBase):
+    """流式LZP2压缩：分块写入，内存占用与输入大小无关
+
+    只保留2 KiB历史、一个待编码块和约16.5 KB前瞻，每块通过 encode_tokens 从历史处续编，
+    命令直接写入输出；由于哈希表只依赖最后2 KiB历史，结果与 compress_lzp2 逐字节相同。
+    文件头中的原始大小/压缩大小在close时回填，因此输出必须可以seek。
+    with块因异常退出时调用abort()，不编码剩余数据也不回填文件头，避免留下看似完整的截断文件。
+    """
+
+    def __init__(self, sink, level: int = DEFAULT_LEVEL, magic: bytes = LZP2_MAGIC,
+                 chunk_size: int = WRITER_CHUNK_SIZE):
+        super().__init__()
+        if isinstance(sink, (str, os.PathLike)):
+            self._sink = open(sink, 'wb')
+            self._owns_sink = True
+        else:
+            self._sink = sink
+            self._owns_sink = False
+        if not self._sink.seekable():
+            raise ValueError("LZP2Writer 需要可seek的输出以回填文件头")
+        self.level = level
+        self.chunk_size = chunk_size
+        self.original_size = 0
+        self.body_size = 0
+        self._header_pos = self._sink.tell()
+        self._sink.write(magic + b'\x00' * 8)
+        # _buf = 历史(最多2 KiB) + 尚未编码的数据，_start为待编码数据在_buf中的起点
+        self._buf = bytearray()
+        self._start = 0
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        view = memoryview(b).cast('B')
+        for offset in range(0, len(view), self.chunk_size):
+            self._buf += view[offset:offset + self.chunk_size]
+            while len(self._buf) - self._start >= self.chunk_size + WRITER_LOOKAHEAD:
+                self._encode(final=False)
+        self.original_size += len(view)
+        return len(view)
+
+    def _encode(self, final: bool):
+        data = bytes(self._buf)
+        if final:
+            stop_at = None
+        else:
+            # 只编码到前瞻区之前，保证RLE长度和匹配与完整压缩时相同
+            limit = min(self._start + self.chunk_size, len(data) - WRITER_LOOKAHEAD)
+            stop_at = range(limit, len(data))
+        tokens, stop = encode_tokens(data, self._start, self.level, stop_at=stop_at)
+        self._sink.write(tokens)
+        self.body_size += len(tokens)
+        keep_from = max(stop - HISTORY_SIZE, 0)
+        del self._buf[:keep_from]
+        self._start = stop - keep_from
+
+    def close(self):
+        if self.closed:
+            return
+        try:
+            if len(self._buf) > self._start:
+                self._encode(final=True)
+            padding = (16 - (self.body_size % 16)) % 16
+            self._sink.write(b'\x00' * padding)
+            end = self._sink.tell()
+            self._sink.seek(self._header_pos + 8)
+            self._sink.write(struct.pack('<II', self.original_size, self.body_size + padding))
+            self._sink.seek(end)
+            self._buf = bytearray()
+        finally:
+            if self._owns_sink:
+                self._sink.close()
+            super().close()
+
+    def abort(self):
+        """放弃压缩：丢弃缓冲的数据，文件头保持为0大小的占位，不写出填充"""
+        if self.closed:
+            return
+        self._buf = bytearray()
+        try:
+            if self._owns_sink:
+                self._sink.close()
+        finally:
+            super().close()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            self.abort()
+        else:
+            self.close()
+
+def compress_lzp2_stream(in_stream: BinaryIO, out_path, level: int = DEFAULT_LEVEL):
+    """从输入流分块读取并流式压缩到文件
+
+    先写入同目录下的临时文件，成功后再替换为目标文件；中途出错（包括Ctrl-C）时删除临时文件，
+    不会留下截断的输出，也不会破坏已存在的目标文件。
+    """
+    temp_path = f"{out_path}.part"
+    try:
+        with LZP2Writer(temp_path, level) as writer:
+            shutil.copyfileobj(in_stream, writer, WRITER_CHUNK_SIZE)
+        os.replace(temp_path, out_path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+# -------------------------- 增量压缩 --------------------------
+def token_positions(bytesIn: bytes, original_size: int) -> Tuple[List[int], List[int]]:
+    """只扫描命令头（不解码），返回每条命令开始处的输出位置与输入位置
+
+    最后一项为命令流结束处（不含末尾填充）。
+    """
+    outs, ins = [], []
+    pos, out = 0x10, 0
+    while out < original_size and pos < len(bytesIn):
+        outs.append(out)
+        ins.append(pos)
+        cmd = bytesIn[pos]
+        if cmd & 0x80:
+            out += ((cmd >> 3) & 0x0F) + 3
+            pos += 2
+        elif cmd & 0x40:
+            out += (((cmd & 0x3F) << 8) | bytesIn[pos + 1]) + 4
+            pos += 3
+        else:
+            out += cmd
+            pos += 1 + cmd
+    outs.append(out)
+    ins.append(min(pos, len(bytesIn)))
+    return outs, ins
+
+def common_prefix_length(a: bytes, b: bytes, reverse: bool = False) -> int:
+    """两段数据相同前缀（reverse时为相同后缀）的长度，先按块比较再定位到字节"""
+    limit = min(len(a), len(b))
+    la, lb = len(a), len(b)
+    chunk = 1 << 16
+    n = 0
+    while n < limit:
+        step = min(chunk, limit - n)
+        if reverse:
+            same = a[la - n - step:la - n] == b[lb - n - step:lb - n]
+        else:
+            same = a[n:n + step] == b[n:n + step]
+        if not same:
+            if step == 1:
+                break
+            chunk = max(step // 16, 1)
+            continue
+        n += step
+    return n
+
+def recompress_lzp2(original: bytes, new_data: bytes, level: int = DEFAULT_LEVEL,
+                    old_data: bytes = None) -> Tuple[bytes, dict]:
+    """基于原LZP2文件增量压缩修改后的数据，返回 (压缩结果, 统计信息)
+
+    第一个不同字节之前的命令原样复用；从该命令边界开始用真实编码器重新压缩，
+    直到新的编码位置与原命令流的某个边界对齐，且此处之前2 KiB历史在新旧数据中完全相同，
+    此后的原命令解码结果必然相同，直接拼接。修改少量字节时只需重新压缩几KB。
+    已持有原文件解压结果时可通过old_data传入，省去解压。
+    """
+    magic = original[0:8]
+    if magic not in KNOWN_MAGICS:
+        raise ValueError("Invalid LZP2 file format")
+    if old_data is None:
+        old_data = decompress_lzp2_data(original, magic)
+    outs, ins = token_positions(original, len(old_data))
+
+    prefix = common_prefix_length(old_data, new_data)
+    suffix = common_prefix_length(old_data[prefix:], new_data[prefix:], reverse=True)
+
+    # 复用到第一个不同字节之前的最后一个命令边界
+    cut = bisect.bisect_right(outs, prefix) - 1
+    start = outs[cut]
+
+    # 新数据中满足重新同步条件的位置 -> 原命令流中对应的输入位置
+    delta = len(new_data) - len(old_data)
+    sync_from = len(new_data) - suffix + HISTORY_SIZE
+    stop_at = {out + delta: pos for out, pos in zip(outs, ins) if out + delta >= sync_from}
+
+    tokens, stop = encode_tokens(new_data, start, level, stop_at=stop_at)
+    body = bytearray(original[0x10:ins[cut]])
+    body.extend(tokens)
+    if stop < len(new_data):
+        body.extend(original[stop_at[stop]:ins[-1]])
+
+    padding = (16 - (len(body) % 16)) % 16
+    result = magic + struct.pack('<II', len(new_data), len(body) + padding) + bytes(body) + b'\x00' * padding
+    stats = {"reused_head": start, "recompressed": stop - start, "reused_tail": len(new_data) - stop}
+    return result, stats
+
+# -------------------------- 新参数解析逻辑 --------------------------
+def parse_arguments():
+    """使用argparse处理命令行参数"""
+    parser = argparse.ArgumentParser(
+        description="LZP2压缩工具 v2.1",
+        formatter_class=argparse.RawTextHelpFormatter
+    )
+    
+    # 模式选择
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument("-c", "--compress", metavar=("INPUT", "OUTPUT"), nargs=2,
+                      help="单文件压缩模式\n示例: lzp2.py -c input.txt output.lzp2")
+    group.add_argument("-d", "--decompress", metavar=("INPUT", "OUTPUT"), nargs=2,
+                      help="单文件解压模式\n示例: lzp2.py -d input.lzp2 output.txt")
+    group.add_argument("-bc", "--batch-compress", metavar=("INPUTS", "OUTPUT_DIR"), nargs='+',
+                      help="批量压缩模式\n示例: lzp2.py -bc file1.txt file2.jpg output_dir/")
+    group.add_argument("-bd", "--batch-decompress", metavar=("INPUTS", "OUTPUT_DIR"), nargs='+',
+                      help="批量解压模式\n示例: lzp2.py -bd file1.lzp2 file2.lzp2 output_dir/")
+    group.add_argument("--build-index", metavar="INPUT", nargs='+',
+                      help="为LZP2文件生成随机访问索引（INPUT.idx）\n示例: lzp2.py --build-index big.lzp2")
+    group.add_argument("--estimate", metavar="INPUT", nargs='+',
+                       help="快速估算压缩后大小及误差界（采样编码，不写出文件），可指定目录\n"
+                            "配合 --max-size/--slot-dir 判断能否放入槽位")
+    group.add_argument("--info", "--list", metavar="INPUT", nargs='+', dest="info",
+                       help="只读取文件头列出 .lzp2 文件的原始/压缩大小、压缩率和格式并汇总（不解压）\n"
+                            "示例: lzp2.py --info data/ --format json")
+    group.add_argument("--recompress", metavar=("ORIGINAL", "EDITED", "OUTPUT"), nargs=3,
+                       help="增量压缩：复用原LZP2文件中未受修改影响的命令，只重新压缩修改附近的数据")
+    group.add_argument("--read-range", metavar=("INPUT", "OFFSET", "LENGTH", "OUTPUT"), nargs=4,
+                      help="只解压指定范围（有索引时从最近检查点开始）\n示例: lzp2.py --read-range big.lzp2 1048576 256 part.bin")
+
+    # 压缩选项
+    parser.add_argument("-l", "--level", type=int, choices=sorted(COMPRESSION_LEVELS), default=DEFAULT_LEVEL,
+                        help=f"压缩等级（默认：{DEFAULT_LEVEL}），未指定槽位大小时使用")
+    parser.add_argument("--max-size", type=int, metavar="BYTES",
+                        help="压缩结果（含文件头）的最大字节数，超出时自动升级压缩等级")
+    parser.add_argument("--slot-dir", metavar="DIR",
+                        help="批量压缩时以该目录下相同相对路径（按输入子目录镜像）的原始 .lzp2 文件大小作为每个文件的槽位大小")
+
+    parser.add_argument("--format", choices=["table", "json"], default="table",
+                        help="--info 的输出格式（默认：table）")
+    parser.add_argument("--index-interval", type=int, default=DEFAULT_INDEX_INTERVAL // 1024, metavar="KIB",
+                        help=f"索引检查点间隔（KiB，默认：{DEFAULT_INDEX_INTERVAL // 1024}）")
+
+    # 批量选项
+    parser.add_argument("--dedup", action="store_true",
+                        help="批量模式下内容相同的文件只处理一次，其余输出通过链接/复制生成")
+    parser.add_argument("-j", "--jobs", type=int, default=0,
+                        help="批量模式并行进程数，>0 时启用读/编解码/写重叠的异步流水线（默认：0 串行）")
+    parser.add_argument("--queue-size", type=int, default=0,
+                        help="流水线各段之间的队列长度（默认：2×进程数）")
+    parser.add_argument("--max-memory", type=int, metavar="MIB",
+                        help="流水线中同时在途任务的估算峰值内存上限（MiB），\n"
+                             "大文件放不下时由小文件填满剩余内存，单个超限的文件独自运行")
+    parser.add_argument("--manifest", metavar="FILE",
+                        help="批量模式写出校验清单（路径、大小、压缩率、CRC32/SHA-256、耗时）\n.csv 为CSV，其他为JSON Lines")
+    parser.add_argument("--dedup-link", choices=["hard", "copy"], default="hard",
+                        help="重复文件的生成方式：hard 硬链接（默认，失败时复制），copy 复制")
+    parser.add_argument("--include", action="append", default=[], metavar="GLOB",
+                        help="批量模式只处理匹配的文件（匹配文件名或相对路径，可多次指定）")
+    parser.add_argument("--exclude", action="append", default=[], metavar="GLOB",
+                        help="批量模式跳过匹配的文件或目录（可多次指定）")
+    telemetry.add_arguments(parser)
+
+    return parser.parse_args()
+
+# -------------------------- 增强版批量处理 --------------------------
+# 文件发现线程最多领先处理多少个文件
+DISCOVERY_QUEUE_SIZE = 1024
+
+def match_glob(relative: str, name: str, patterns) -> bool:
+    """通配符同时匹配相对路径（/分隔）和文件名"""
+    return any(fnmatch.fnmatch(relative, pattern) or fnmatch.fnmatch(name, pattern) for pattern in patterns)
+
+def scan_tree(root: str, exclude=()):
+    """用os.scandir深度优先遍历目录树，逐个产出 (文件路径, 相对路径)
+
+    不预先收集整个列表，边遍历边产出；被exclude匹配的子目录整个跳过，不跟随目录符号链接。
+    """
+    stack = [("", root)]
+    while stack:
+        relative_dir, path = stack.pop()
+        subdirs = []
+        try:
+            with os.scandir(path) as entries:
+                for entry in entries:
+                    relative = relative_dir + entry.name
+                    if entry.is_dir(follow_symlinks=False):
+                        if not match_glob(relative, entry.name, exclude):
+                            subdirs.append((relative + "/", entry.path))
+                    elif entry.is_file():
+                        yield entry.path, relative
+        except OSError as e:
+            print(f"[✗] 无法读取目录 {path}: {str(e)}")
+        stack.extend(reversed(subdirs))
+
+def iter_batch_files(mode: str, inputs: List[str], include=(), exclude=()):
+    """展开批量输入，逐个产出 (输入文件, 相对路径)
+
+    目录输入流式遍历，相对路径相对于该目录，输出按它镜像子目录；直接指定的文件相对路径为文件名。
+    解压模式只选择 .lzp2 文件，include/exclude 对目录中的文件和直接指定的文件同样生效。
+    """
+    def selected(relative, name):
+        if mode == "d" and not name.endswith(".lzp2"):
+            return False
+        if include and not match_glob(relative, name, include):
+            return False
+        return not match_glob(relative, name, exclude)
+
+    for input_path in inputs:
+        if os.path.isdir(input_path):
+            for path, relative in scan_tree(input_path, exclude):
+                if selected(relative, os.path.basename(relative)):
+                    yield Path(path), Path(relative)
+        else:
+            name = os.path.basename(input_path)
+            if selected(name, name):
+                yield Path(input_path), Path(name)
+
+def prefetch(items, maxsize: int = DISCOVERY_QUEUE_SIZE):
+    """在后台线程中遍历items并放入有界队列，调用方可立即开始处理已发现的项"""
+    work = queue.Queue(maxsize)
+    done = object()
+
+    def produce():
+        try:
+            for item in items:
+                work.put((item, None))
+        except Exception as e:
+            work.put((None, e))
+        work.put((done, None))
+
+    threading.Thread(target=produce, daemon=True).start()
+    while True:
+        item, error = work.get()
+        if error is not None:
+            raise error
+        if item is done:
+            return
+        yield item
+
+def batch_output_path(mode: str, relative: Path, output_dir: Path) -> Path:
+    """批量模式下输入文件对应的输出路径（按相对路径保留子目录）"""
+    if mode == "c":
+        return output_dir / relative.parent / f"{relative.name}.lzp2"
+    return output_dir / relative.parent / relative.stem
+
+def file_digest(path: Path) -> str:
+    """计算文件内容的BLAKE2b摘要，用于识别重复文件"""
+    digest = hashlib.blake2b(digest_size=20)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def group_duplicates(files: List[Path]) -> List[List[Path]]:
+    """按内容分组：先按大小分桶，只有大小相同的文件才需要计算哈希"""
+    by_size: Dict[int, List[Path]] = {}
+    for file in files:
+        by_size.setdefault(file.stat().st_size, []).append(file)
+
+    groups = []
+    for same_size in by_size.values():
+        if len(same_size) == 1:
+            groups.append(same_size)
+            continue
+        by_digest: Dict[str, List[Path]] = {}
+        for file in same_size:
+            by_digest.setdefault(file_digest(file), []).append(file)
+        groups.extend(by_digest.values())
+    return groups
+
+def materialize_duplicate(result: Path, target: Path, link: str = "hard"):
+    """用硬链接（失败时退回复制）生成重复文件的输出"""
+    if target == result:
+        return
+    if target.exists():
+        target.unlink()
+    target.parent.mkdir(parents=True, exist_ok=True)
+    if link == "hard":
+        try:
+            os.link(result, target)
+            return
+        except OSError:
+            pass
+    shutil.copyfile(result, target)
+
+def slot_path(relative: Path, slot_dir: str) -> Path:
+    """槽位目录中与输入对应的原始 .lzp2 文件，与输出一样按相对路径镜像子目录"""
+    return batch_output_path("c", relative, Path(slot_dir))
+
+def batch_budget(relative: Path, max_size: int = None, slot_dir: str = None):
+    """计算压缩输出的大小上限：指定槽位目录时取原始封包中相同相对路径的文件大小"""
+    if slot_dir:
+        return slot_path(relative, slot_dir).stat().st_size
+    return max_size
+
+def dedup_groups(mode: str, relative: Dict[Path, Path], slot_dir: str = None) -> List[List[Path]]:
+    """内容相同且槽位大小相同的文件归为一组，每组只需处理第一个；relative为 {输入文件: 相对路径}"""
+    groups = []
+    for group in group_duplicates(list(relative)):
+        # 槽位大小不同的文件即使内容相同也要分别压缩
+        by_slot: Dict[object, List[Path]] = {}
+        for file in group:
+            slot = slot_path(relative[file], slot_dir) if slot_dir and mode == "c" else None
+            key = slot.stat().st_size if slot is not None and slot.exists() else None
+            by_slot.setdefault(key, []).append(file)
+        groups.extend(by_slot.values())
+    return groups
+
+def process_batch(mode: str, inputs: List[str], output_dir: str, level: int = DEFAULT_LEVEL,
+                  max_size: int = None, slot_dir: str = None, dedup: bool = False, link: str = "hard",
+                  jobs: int = 0, queue_size: int = 0, manifest: str = None, progress: Progress = None,
+                  include=(), exclude=(), max_memory: int = None):
+    """处理批量模式；jobs>0时使用asyncio流水线让读、压缩、写重叠进行
+
+    指定manifest时，在编解码的同时计算输入输出的CRC32与SHA-256并写出清单，无需事后再读一遍。
+    progress记录逐文件的吞吐量与读/编解码/写各阶段耗时。
+    文件在后台线程中边遍历边送入有界队列，处理不必等整个目录树遍历完。
+    max_memory（字节）限制流水线中同时在途任务的估算峰值内存之和。
+    """
+    output_path = Path(output_dir)
+    output_path.mkdir(parents=True, exist_ok=True)
+    if progress is None:
+        progress = Progress("lzp2")
+    
+    if dedup:
+        # 去重模式：相同内容只压缩/解压一次，其余输出由结果链接或复制得到
+        relative = dict(iter_batch_files(mode, inputs, include, exclude))
+        groups = dedup_groups(mode, relative, slot_dir)
+        work = [(group[0], relative[group[0]]) for group in groups]
+        progress.add_total(files=len(work))
+    else:
+        def discovered():
+            for item in iter_batch_files(mode, inputs, include, exclude):
+                progress.add_total(files=1)
+                yield item
+        work = prefetch(discovered())
+
+    if jobs > 0:
+        results = asyncio.run(process_batch_async(mode, work, output_path, jobs, level, max_size,
+                                                  slot_dir, queue_size, manifest is not None, progress,
+                                                  max_memory))
+    else:
+        results = {}
+        for input_file, relative_path in work:
+            results[input_file] = (process_single(mode, input_file, output_path, level, max_size,
+                                                  slot_dir, manifest is not None, progress, relative_path)
+                                   or (None, 0.0, None))
+
+    entries = [manifest_entry(input_file, *result) for input_file, result in results.items()
+               if manifest and result[0] is not None]
+    processed = len(results)
+    if not dedup:
+        if manifest:
+            write_manifest(manifest, entries)
+        progress.finish()
+        print(f"\n操作完成！成功处理 {processed} 个文件")
+        return
+
+    saved_bytes = 0
+    saved_seconds = 0.0
+    duplicates = 0
+    for group in groups:
+        result, elapsed, checks = results[group[0]]
+        if result is None:
+            continue
+        for file in group[1:]:
+            target = batch_output_path(mode, relative[file], output_path)
+            try:
+                materialize_duplicate(result, target, link)
+                progress.log(f"[=] {file} -> {target.relative_to(output_path)} (重复内容)")
+                if manifest:
+                    entries.append(manifest_entry(file, target, 0.0, checks))
+                duplicates += 1
+                processed += 1
+                saved_bytes += file.stat().st_size
+                saved_seconds += elapsed
+            except OSError as e:
+                print(f"[✗] 处理失败 {file}: {str(e)}")
+
+    if manifest:
+        write_manifest(manifest, entries)
+    progress.finish()
+    print(f"\n操作完成！成功处理 {processed} 个文件")
+    print(f"去重：{duplicates} 个重复文件，节省处理 {saved_bytes} 字节，约 {saved_seconds:.2f} 秒CPU时间")
+
+def process_single(mode: str, input_file: Path, output_dir: Path, level: int = DEFAULT_LEVEL,
+                   max_size: int = None, slot_dir: str = None, checksums: bool = False,
+                   progress: Progress = None, relative: Path = None):
+    """处理单个文件，成功时返回 (输出路径, 编解码耗时, 校验信息)，失败时返回None
+
+    relative为输出相对于output_dir的路径（默认为文件名）；文件筛选已由 iter_batch_files 完成。
+    """
+    progress = progress or Progress("lzp2")
+    start = time.perf_counter()
+    nbytes = 0
+    try:
+        # 生成输出路径
+        relative = relative or Path(input_file.name)
+        output = batch_output_path(mode, relative, output_dir)
+        budget = batch_budget(relative, max_size, slot_dir) if mode == "c" else None
+        with progress.stage("read"):
+            data = read_file(input_file)
+        nbytes = len(data)
+        with progress.stage("codec"):
+            result, elapsed, checks = codec_job(mode, data, level, budget, checksums)
+        with progress.stage("write"):
+            write_file(output, result)
+        
+        progress.file_done(input_file, nbytes, time.perf_counter() - start, output_bytes=len(result))
+        progress.log(f"[✓] {input_file} -> {output.relative_to(output_dir)}")
+        return output, elapsed, checks
+    except PermissionError:
+        print(f"[✗] 权限拒绝: {input_file}")
+    except Exception as e:
+        print(f"[✗] 处理失败 {input_file}: {str(e)}")
+    progress.file_done(input_file, nbytes, time.perf_counter() - start, ok=False)
+    return None
+
+# -------------------------- 异步批量流水线 --------------------------
+def read_file(path: Path) -> bytes:
+    with open(path, 'rb') as f:
+        return f.read()
+
+def write_file(path: Path, data: bytes):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(data)
+
+def codec_job(mode: str, data: bytes, level: int = DEFAULT_LEVEL, max_size: int = None,
+              checksums: bool = False) -> Tuple[bytes, float, tuple]:
+    """在进程池中执行的纯CPU任务，返回 (结果, CPU耗时, 输入/输出校验信息或None)"""
+    start = time.process_time()
+    if mode == "c":
+        result = compress_lzp2(data, level) if max_size is None else compress_to_fit(data, max_size)[0]
+    else:
+        result = decompress_lzp2_data(data)
+    elapsed = time.process_time() - start
+    # 数据已在内存中，顺便计算校验值
+    checks = (checksum_record(data), checksum_record(result)) if checksums else None
+    return result, elapsed, checks
+
+# -------------------------- 内存感知调度 --------------------------
+# 单个任务的峰值内存按文件大小和编解码方式估算（以下系数来自tracemalloc实测）：
+# 主进程与子进程各持有一份输入，结果的bytearray、bytes副本及回传主进程的副本各约一份
+# （不可压缩数据的输出略大于输入），RLE长度表每字节2字节。
+TRANSFER_MEMORY_FACTOR = 5.5
+RLE_TABLE_BYTES = 2
+# 纯Python后端：输出缓冲一份，哈希表每个出现过的三元组键约190字节（键在窗口外也不会删除）
+HASH_ENTRY_BYTES = 200
+HASH_MAX_KEYS = 1 << 24
+# 估算三元组键数量时采样文件开头的字节数
+HASH_SAMPLE_SIZE = 64 * 1024
+# NumPy后端：每字节4字节的链表，加上按段分配的临时数组（每字节约24字节，与段大小成正比）
+CHAIN_TEMP_BYTES = 24
+# 解压：两份输入，加上输出的bytearray、bytes副本和回传主进程的结果
+DECOMPRESS_MEMORY_FACTOR = 3
+JOB_MEMORY_OVERHEAD = 1 << 20
+# 调度窗口：最多在多少个已发现的文件中挑选能放入剩余内存的任务
+MEMORY_LOOKAHEAD = 64
+# 队首的大文件最多被后面的小文件插队多少次，之后等待内存腾空，避免一直排不上
+MEMORY_MAX_BYPASS = 256
+
+def job_memory(mode: str, path: Path) -> int:
+    """根据文件大小和编解码方式估算单个任务的峰值内存（字节），只读取文件头或开头的采样"""
+    size = path.stat().st_size
+    with open(path, 'rb') as f:
+        head = f.read(HASH_SAMPLE_SIZE if mode == "c" else 16)
+
+    if mode == "d":
+        # 解压后的大小记录在文件头中
+        original_size = struct.unpack_from('<I', head, 8)[0] if len(head) == 16 else size
+        return DECOMPRESS_MEMORY_FACTOR * original_size + 2 * size + JOB_MEMORY_OVERHEAD
+
+    memory = int(TRANSFER_MEMORY_FACTOR * size) + RLE_TABLE_BYTES * size + JOB_MEMORY_OVERHEAD
+    if CANDIDATE_BACKEND == "numpy":
+        return memory + 4 * size + CHAIN_TEMP_BYTES * min(size, CHAIN_SEGMENT_SIZE + CHAIN_OVERLAP)
+    # 哈希表大小取决于数据中不同三元组的数量：按开头采样的密度外推（高熵数据接近每字节一个键）
+    density = len({head[i:i + 3] for i in range(len(head) - 2)}) / max(len(head) - 2, 1)
+    return memory + size + HASH_ENTRY_BYTES * min(int(density * size), HASH_MAX_KEYS)
+
+class MemoryGate:
+    """异步流水线的内存准入控制：在途任务（从读取到写入完成）的估算内存之和不超过limit
+
+    队首任务放不下时，窗口中后面能放下的小文件可以先行，填满剩余内存；
+    单个任务超过limit时等到没有其他在途任务再单独运行。limit为None时不做限制。
+    只在事件循环线程中使用，无需加锁。
+    """
+
+    def __init__(self, limit: int = None):
+        self.limit = limit
+        self.in_flight = 0
+        self.peak = 0
+        self._released = asyncio.Event()
+
+    def fits(self, need: int) -> bool:
+        return self.limit is None or self.in_flight == 0 or self.in_flight + need <= self.limit
+
+    def _select(self, pending: deque):
+        head = pending[0]
+        if self.fits(head[2]):
+            return head
+        if head[3] >= MEMORY_MAX_BYPASS:
+            return None
+        for item in pending:
+            if self.fits(item[2]):
+                head[3] += 1
+                return item
+        return None
+
+    async def admit(self, pending: deque):
+        """等待直到pending中有任务可以放入，取出并返回 [输入文件, 相对路径, 内存, 被插队次数]"""
+        while (item := self._select(pending)) is None:
+            self._released.clear()
+            await self._released.wait()
+        pending.remove(item)
+        self.in_flight += item[2]
+        self.peak = max(self.peak, self.in_flight)
+        return item
+
+    def release(self, need: int):
+        self.in_flight -= need
+        self._released.set()
+
+async def process_batch_async(mode: str, files, output_dir: Path, jobs: int, level: int = DEFAULT_LEVEL,
+                              max_size: int = None, slot_dir: str = None, queue_size: int = 0,
+                              checksums: bool = False, progress: Progress = None, max_memory: int = None):
+    """读取 → 压缩/解压 → 写入 三段流水线
+
+    files为 (输入文件, 相对路径) 的可迭代对象，在线程池中逐个取出，遍历目录不会阻塞事件循环。
+    读写在线程池中进行，编解码在进程池中进行，各段之间用有界队列连接：
+    读取提前进行但不会无限占用内存，写入在后台完成，整体吞吐接近磁盘与CPU中较慢的一方。
+    指定max_memory（字节）时，按 job_memory 的估算只在在途任务内存之和不超过它时才开始读取新文件。
+    返回 {输入文件: (输出路径或None, CPU耗时, 校验信息或None)}。
+    """
+    loop = asyncio.get_running_loop()
+    read_queue: asyncio.Queue = asyncio.Queue(queue_size or jobs * 2)
+    write_queue: asyncio.Queue = asyncio.Queue(queue_size or jobs * 2)
+    results = {}
+    progress = progress or Progress("lzp2")
+    # 每个文件从开始读取到写入完成的墙钟时间
+    started = {}
+    gate = MemoryGate(max_memory)
+    reserved = {}
+
+    def fail(input_file, error):
+        if isinstance(error, PermissionError):
+            print(f"[✗] 权限拒绝: {input_file}")
+        else:
+            print(f"[✗] 处理失败 {input_file}: {str(error)}")
+        results[input_file] = (None, 0.0, None)
+        gate.release(reserved.pop(input_file, 0))
+        progress.file_done(input_file, 0, time.perf_counter() - started.pop(input_file, time.perf_counter()),
+                           ok=False)
+
+    async def timed(stage, pool, func, *args):
+        start = time.perf_counter()
+        try:
+            return await loop.run_in_executor(pool, func, *args)
+        finally:
+            progress.add_stage(stage, time.perf_counter() - start)
+
+    with ProcessPoolExecutor(max_workers=jobs) as cpu_pool, ThreadPoolExecutor(max_workers=4) as io_pool:
+        async def reader():
+            items = iter(files)
+            pending = deque()
+            exhausted = False
+            lookahead = 1 if max_memory is None else MEMORY_LOOKAHEAD
+            while pending or not exhausted:
+                while not exhausted and len(pending) < lookahead:
+                    item = await loop.run_in_executor(io_pool, next, items, None)
+                    if item is None:
+                        exhausted = True
+                        break
+                    try:
+                        need = 0 if max_memory is None else await loop.run_in_executor(
+                            io_pool, job_memory, mode, item[0])
+                    except OSError as e:
+                        fail(item[0], e)
+                        continue
+                    pending.append([*item, need, 0])
+                if not pending:
+                    break
+
+                start = time.perf_counter()
+                input_file, relative, need, _ = await gate.admit(pending)
+                if max_memory is not None:
+                    progress.add_stage("memory-wait", time.perf_counter() - start)
+                reserved[input_file] = need
+                output = batch_output_path(mode, relative, output_dir)
+                started[input_file] = time.perf_counter()
+                try:
+                    budget = batch_budget(relative, max_size, slot_dir) if mode == "c" else None
+                    data = await timed("read", io_pool, read_file, input_file)
+                except Exception as e:
+                    fail(input_file, e)
+                    continue
+                await read_queue.put((input_file, output, data, budget))
+            for _ in range(jobs):
+                await read_queue.put(None)
+
+        async def worker():
+            while (item := await read_queue.get()) is not None:
+                input_file, output, data, budget = item
+                try:
+                    result, elapsed, checks = await timed(
+                        "codec", cpu_pool, codec_job, mode, data, level, budget, checksums)
+                except Exception as e:
+                    fail(input_file, e)
+                    continue
+                await write_queue.put((input_file, output, len(data), result, elapsed, checks))
+
+        async def writer():
+            while (item := await write_queue.get()) is not None:
+                input_file, output, nbytes, result, elapsed, checks = item
+                try:
+                    await timed("write", io_pool, write_file, output, result)
+                except Exception as e:
+                    fail(input_file, e)
+                    continue
+                results[input_file] = (output, elapsed, checks)
+                gate.release(reserved.pop(input_file, 0))
+                progress.file_done(input_file, nbytes, time.perf_counter() - started.pop(input_file),
+                                   output_bytes=len(result))
+                progress.log(f"[✓] {input_file} -> {output.relative_to(output_dir)}")
+
+        writer_task = asyncio.create_task(writer())
+        await asyncio.gather(reader(), *(worker() for _ in range(jobs)))
+        await write_queue.put(None)
+        await writer_task
+
+    if max_memory is not None:
+        progress.log(f"在途任务估算内存峰值: {gate.peak / (1 << 20):.1f} MiB（上限 {max_memory / (1 << 20):.1f} MiB）")
+    return results
+
+# -------------------------- 校验清单 --------------------------
+MANIFEST_FIELDS = ["input", "output", "input_size", "output_size", "ratio", "input_crc32",
+                   "input_sha256", "output_crc32", "output_sha256", "seconds"]
+
+def checksum_record(data: bytes) -> Tuple[int, str, str]:
+    """返回 (大小, CRC32, SHA-256)"""
+    return len(data), f"{zlib.crc32(data):08x}", hashlib.sha256(data).hexdigest()
+
+def manifest_entry(input_file: Path, output: Path, elapsed: float, checks) -> dict:
+    (in_size, in_crc, in_sha), (out_size, out_crc, out_sha) = checks
+    return {
+        "input": str(input_file), "output": str(output),
+        "input_size": in_size, "output_size": out_size,
+        "ratio": round(out_size / in_size, 4) if in_size else 0,
+        "input_crc32": in_crc, "input_sha256": in_sha,
+        "output_crc32": out_crc, "output_sha256": out_sha,
+        "seconds": round(elapsed, 4),
+    }
+
+def write_manifest(manifest_path: str, entries: List[dict]):
+    """写出校验清单：.csv 为CSV，其他扩展名为JSON Lines"""
+    if manifest_path.lower().endswith('.csv'):
+        with open(manifest_path, 'w', encoding='utf-8', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=MANIFEST_FIELDS)
+            writer.writeheader()
+            writer.writerows(entries)
+    else:
+        with open(manifest_path, 'w', encoding='utf-8') as f:
+            for entry in entries:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+    print(f"校验清单已写入: {manifest_path} ({len(entries)} 条)")
+
+# -------------------------- 文件头清单 --------------------------
+# 清单模式每个线程任务处理的文件数，只读16字节时瓶颈是open/stat的系统调用和逐个任务的调度开销
+INFO_CHUNK_SIZE = 256
+INFO_STATUS_LABELS = {"ok": "正常", "trailing": "尾部多余", "truncated": "截断",
+                      "bad-magic": "魔数错误", "short": "文件过短"}
+
+def read_header_info(path: Path) -> dict:
+    """只读取16字节文件头，返回大小、压缩率、格式与校验状态
+
+    文件大小应为 16 + compressed_size；更小说明被截断，更大说明尾部有多余数据（如槽位填充）。
+    """
+    with open(path, 'rb') as f:
+        header = f.read(16)
+        file_size = os.fstat(f.fileno()).st_size
+    info = {"path": str(path), "file_size": file_size, "profile": None,
+            "original_size": None, "compressed_size": None, "ratio": None}
+    if len(header) < 16:
+        info["status"] = "short"
+        return info
+    info["profile"] = KNOWN_MAGICS.get(header[:8])
+    if info["profile"] is None:
+        info["status"] = "bad-magic"
+        return info
+    original_size, compressed_size = struct.unpack_from('<II', header, 8)
+    info["original_size"] = original_size
+    info["compressed_size"] = compressed_size
+    info["ratio"] = round(file_size / original_size, 4) if original_size else 0
+    expected = 16 + compressed_size
+    info["status"] = "ok" if file_size == expected else "truncated" if file_size < expected else "trailing"
+    return info
+
+def read_header_chunk(paths: List[Path]) -> List[dict]:
+    entries = []
+    for path in paths:
+        try:
+            entries.append(read_header_info(path))
+        except OSError as e:
+            entries.append({"path": str(path), "file_size": None, "profile": None, "original_size": None,
+                            "compressed_size": None, "ratio": None, "status": "error", "error": str(e)})
+    return entries
+
+def inventory_lzp2(inputs: List[str], include=(), exclude=(), jobs: int = 0) -> Tuple[List[dict], dict]:
+    """为输入中的全部 .lzp2 文件生成文件头清单，返回 (逐文件信息, 按格式汇总)
+
+    目录在后台线程中用scandir流式遍历，文件头按块在线程池中并行读取，在途的块数有上限。
+    """
+    workers = jobs or min(32, (os.cpu_count() or 1) + 4)
+    entries = []
+    pending = deque()
+    chunk = []
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for input_file, _ in prefetch(iter_batch_files("d", inputs, include, exclude)):
+            chunk.append(input_file)
+            if len(chunk) == INFO_CHUNK_SIZE:
+                pending.append(pool.submit(read_header_chunk, chunk))
+                chunk = []
+                if len(pending) >= 2 * workers:
+                    entries.extend(pending.popleft().result())
+        if chunk:
+            pending.append(pool.submit(read_header_chunk, chunk))
+        for future in pending:
+            entries.extend(future.result())
+
+    totals = {}
+    for entry in entries:
+        key = entry["profile"] if entry["status"] in ("ok", "trailing") else "invalid"
+        total = totals.setdefault(key, {"files": 0, "original_size": 0, "file_size": 0})
+        total["files"] += 1
+        total["file_size"] += entry["file_size"] or 0
+        if key != "invalid":
+            total["original_size"] += entry["original_size"]
+    for total in totals.values():
+        total["ratio"] = round(total["file_size"] / total["original_size"], 4) if total["original_size"] else 0
+    return entries, totals
+
+def print_inventory(entries: List[dict], totals: dict):
+    """以表格形式输出清单和汇总"""
+    print(f"{'原始大小':>12} {'压缩大小':>12} {'文件大小':>12} {'压缩率':>7}  {'格式':<8} {'状态':<6} 路径")
+    for entry in entries:
+        ratio = f"{entry['ratio']:.1%}" if entry["ratio"] is not None else "-"
+        print(f"{entry['original_size'] if entry['original_size'] is not None else '-':>12} "
+              f"{entry['compressed_size'] if entry['compressed_size'] is not None else '-':>12} "
+              f"{entry['file_size'] if entry['file_size'] is not None else '-':>12} {ratio:>7}  "
+              f"{entry['profile'] or '-':<8} {INFO_STATUS_LABELS.get(entry['status'], entry['status']):<6} "
+              f"{entry['path']}")
+    print("\n合计:")
+    for profile, total in totals.items():
+        if profile == "invalid":
+            print(f"  {'无效':<8} {total['files']} 个文件，文件 {total['file_size']} 字节")
+        else:
+            print(f"  {profile:<8} {total['files']} 个文件，原始 {total['original_size']} 字节，"
+                  f"文件 {total['file_size']} 字节，压缩率 {total['ratio']:.1%}")
+
+# -------------------------- 主程序逻辑 --------------------------
+def memory_limit(args):
+    """--max-memory（MiB）换算为字节；未启用流水线时串行处理，不需要限制"""
+    if args.max_memory is None:
+        return None
+    if args.jobs <= 0:
+        print("提示: --max-memory 仅在 -j/--jobs > 0 的流水线模式下生效")
+    return args.max_memory << 20
+
+def main():
+    args = parse_arguments()
+    
+    # 单文件模式
+    if args.compress:
+        input_file, output_file = args.compress
+        try:
+            used_level = compress_lzp2_file(input_file, output_file, args.level, args.max_size)
+        except BudgetExceeded as e:
+            print(f"[✗] 处理失败 {input_file}: {str(e)}")
+            sys.exit(1)
+        print(f"单文件压缩完成: {input_file} -> {output_file} (等级 {used_level})")
+    
+    elif args.decompress:
+        input_file, output_file = args.decompress
+        decompress_lzp2_file(input_file, output_file)
+        print(f"单文件解压完成: {input_file} -> {output_file}")
+    
+    # 批量压缩模式
+    elif args.batch_compress:
+        *inputs, output_dir = args.batch_compress
+        process_batch("c", inputs, output_dir, args.level, args.max_size, args.slot_dir,
+                      args.dedup, args.dedup_link, args.jobs, args.queue_size, args.manifest,
+                      Progress("lzp2 -bc", live=args.progress, jsonl_path=args.log_jsonl, quiet=args.quiet),
+                      args.include, args.exclude, memory_limit(args))
+    
+    # 批量解压模式
+    elif args.batch_decompress:
+        *inputs, output_dir = args.batch_decompress
+        process_batch("d", inputs, output_dir, dedup=args.dedup, link=args.dedup_link,
+                      jobs=args.jobs, queue_size=args.queue_size, manifest=args.manifest,
+                      progress=Progress("lzp2 -bd", live=args.progress, jsonl_path=args.log_jsonl,
+                                        quiet=args.quiet),
+                      include=args.include, exclude=args.exclude, max_memory=memory_limit(args))
+
+    # 随机访问索引
+    elif args.build_index:
+        interval = args.index_interval * 1024
+        for input_file in args.build_index:
+            with open(input_file, 'rb') as f:
+                data = f.read()
+            checkpoints = build_lzp2_index(data, interval)
+            write_lzp2_index(f"{input_file}.idx", checkpoints, input_file, interval)
+            print(f"索引生成完成: {input_file}.idx ({len(checkpoints)} 个检查点)")
+
+    elif args.read_range:
+        input_file, offset, length, output_file = args.read_range
+        with open_lzp2(input_file) as reader:
+            reader.seek(int(offset, 0))
+            data = reader.read(int(length, 0))
+        with open(output_file, 'wb') as f:
+            f.write(data)
+        print(f"范围读取完成: {input_file}[{offset}:+{len(data)}] -> {output_file}")
+
+    # 增量压缩
+    elif args.recompress:
+        original_file, edited_file, output_file = args.recompress
+        with open(original_file, 'rb') as f:
+            original = f.read()
+        with open(edited_file, 'rb') as f:
+            edited = f.read()
+        compressed, stats = recompress_lzp2(original, edited, args.level)
+        with open(output_file, 'wb') as f:
+            f.write(compressed)
+        print(f"增量压缩完成: {output_file}")
+        print(f"  复用头部 {stats['reused_head']} 字节，重新压缩 {stats['recompressed']} 字节，"
+              f"复用尾部 {stats['reused_tail']} 字节")
+
+    # 文件头清单
+    elif args.info:
+        entries, totals = inventory_lzp2(args.info, args.include, args.exclude, args.jobs)
+        if args.format == "json":
+            print(json.dumps({"files": entries, "totals": totals}, ensure_ascii=False, indent=1))
+        else:
+            print_inventory(entries, totals)
+        if "invalid" in totals:
+            sys.exit(1)
+
+    # 压缩大小估算
+    elif args.estimate:
+        fit_labels = {"fits": "可放入", "overflows": "超出", "uncertain": "不确定"}
+        total_input = total_estimate = total_bound = 0
+        count = 0
+        for input_file, relative in iter_batch_files("c", args.estimate, args.include, args.exclude):
+            try:
+                data = read_file(input_file)
+                estimate, bound = estimate_lzp2_size(data, args.level)
+                budget = batch_budget(relative, args.max_size, args.slot_dir)
+            except PermissionError:
+                print(f"[✗] 权限拒绝: {input_file}")
+                continue
+            except Exception as e:
+                print(f"[✗] 处理失败 {input_file}: {str(e)}")
+                continue
+            count += 1
+            total_input += len(data)
+            total_estimate += estimate
+            total_bound += bound
+            # 误差界为0表示文件较小、已完整压缩，给出的是精确大小
+            size_text = f"{estimate} 字节（完整压缩，精确值）" if bound == 0 else f"约 {estimate} ± {bound} 字节"
+            line = f"{input_file}: {len(data)} -> {size_text} ({estimate / max(len(data), 1):.1%})"
+            if budget is not None:
+                line += f" | 槽位 {budget} 字节: {fit_labels[estimate_fit(estimate, bound, budget)]}"
+            print(line)
+        if count > 1:
+            print(f"\n合计: {count} 个文件，{total_input} -> 约 {total_estimate} ± {total_bound} 字节")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,498 @@
+import io
+import os
+import sys
+import mmap
+import zlib
+import struct
+import hashlib
+import argparse
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator, List, Tuple
+
+import lzp2
+
+# 各层数据的识别魔数
+LZP2_TAG = b'LZP2'
+G1T_TAG = b'GT1G'
+TIM2_TAG = b'TIM2'
+
+# 嵌套层数上限，防止误判的封包表导致无限递归
+MAX_DEPTH = 8
+# 解压结果缓存的默认容量（字节）
+DEFAULT_CACHE_SIZE = 256 << 20
+
+# 差分补丁格式：魔数、版本，随后是 COPY（从原封包复制一段）/ DATA（zlib压缩的新数据）操作
+PATCH_MAGIC = b'LZPD'
+PATCH_VERSION = 1
+PATCH_HEADER = struct.Struct('<4sIQQ20s20sI')
+OP_COPY = b'C'
+OP_DATA = b'D'
+# 应用补丁时单次复制的块大小
+COPY_CHUNK = 4 << 20
+
+# -------------------------- 封包表解析 --------------------------
+def read_pack_table(data) -> List[Tuple[int, int]]:
+    """解析封包头部的大小表，返回每个条目的 (偏移, 大小)
+
+    格式与 g1t-export-tools.py 一致：4字节条目数，随后每个条目4字节大小（以16字节为单位），
+    文件头按16字节对齐。
+    """
+    if len(data) < 4:
+        raise ValueError("封包数据过短")
+    num_files = int.from_bytes(data[0:4], 'little')
+    header_size = 4 + 4 * num_files
+    if header_size > len(data):
+        raise ValueError("封包表超出文件范围")
+
+    padding = (16 - (header_size % 16)) % 16
+    current_offset = header_size + padding
+    entries = []
+    for i in range(num_files):
+        size = int.from_bytes(data[4 + 4 * i:8 + 4 * i], 'little') * 16
+        entries.append((current_offset, size))
+        current_offset += size
+    return entries
+
+def looks_like_pack(data) -> bool:
+    """根据大小表是否与数据长度吻合来判断是否为封包（封包没有魔数）"""
+    if len(data) < 16 or bytes(data[0:4]) in (LZP2_TAG, G1T_TAG, TIM2_TAG):
+        return False
+    num_files = int.from_bytes(data[0:4], 'little')
+    if num_files == 0 or 4 + 4 * num_files > len(data):
+        return False
+    entries = read_pack_table(data)
+    end = entries[-1][0] + entries[-1][1]
+    # 允许末尾存在不超过一个扇区的填充
+    return any(size for _, size in entries) and len(data) - 2048 < end <= len(data)
+
+# -------------------------- 嵌套格式流水线 --------------------------
+def walk_layers(name: str, data, depth: int = 0) -> Iterator[Tuple[str, bytes]]:
+    """按魔数逐层解开数据，产出最终的 (输出文件名, 数据)
+
+    LZP2 在内存中解压后继续识别，封包按大小表拆分后对每个条目递归处理，
+    GT1G 按文件头中的大小截断，TIM2 原样输出，无法识别的数据以 .bin 输出。
+    """
+    tag = bytes(data[0:4])
+    if tag == LZP2_TAG and depth < MAX_DEPTH:
+        magic = bytes(data[0:8])
+        if magic in lzp2.KNOWN_MAGICS:
+            yield from walk_layers(name, lzp2.decompress_lzp2_data(bytes(data), magic), depth + 1)
+            return
+    elif tag == G1T_TAG and len(data) >= 16:
+        g1t_size = int.from_bytes(data[8:12], 'little')
+        yield f"{name}.g1t", bytes(data[:min(g1t_size, len(data))])
+        return
+    elif tag == TIM2_TAG:
+        yield f"{name}.tm2", bytes(data)
+        return
+    elif depth < MAX_DEPTH and looks_like_pack(data):
+        for idx, (offset, size) in enumerate(read_pack_table(data)):
+            if size:
+                yield from walk_layers(f"{name}_{idx:04d}", data[offset:offset + size], depth + 1)
+        return
+    yield f"{name}.bin", bytes(data)
+
+def extract_entry(pack_path: str, name: str, offset: int, size: int,
+                  output_dir: str, kinds: Tuple[str, ...]) -> List[str]:
+    """处理封包中的单个条目（在工作进程中运行），只写出最终结果"""
+    written = []
+    with open(pack_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        for out_name, payload in walk_layers(name, mm[offset:offset + size], 1):
+            if kinds and os.path.splitext(out_name)[1][1:] not in kinds:
+                continue
+            with open(os.path.join(output_dir, out_name), 'wb') as out_file:
+                out_file.write(payload)
+            written.append(out_name)
+    return written
+
+def extract_pack(pack_path: str, output_dir: str, jobs: int = 0, kinds: Tuple[str, ...] = ()) -> int:
+    """对一个封包执行完整流水线，条目之间并行处理"""
+    base_name = os.path.splitext(os.path.basename(pack_path))[0]
+    with open(pack_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        if not looks_like_pack(mm):
+            # 不是封包：整个文件作为单个条目处理
+            tasks = [(base_name, 0, len(mm))]
+        else:
+            tasks = [(f"{base_name}_{idx:04d}", offset, size)
+                     for idx, (offset, size) in enumerate(read_pack_table(mm)) if size]
+
+    written = 0
+    with ProcessPoolExecutor(max_workers=jobs or None) as pool:
+        futures = [pool.submit(extract_entry, pack_path, name, offset, size, output_dir, kinds)
+                   for name, offset, size in tasks]
+        for future in futures:
+            for out_name in future.result():
+                print(f"[✓] {os.path.basename(pack_path)} -> {out_name}")
+                written += 1
+    return written
+
+# -------------------------- 虚拟档案 --------------------------
+class DecodedCache:
+    """按字节数限制容量的LRU缓存，保存已解压的条目数据（线程安全）"""
+
+    def __init__(self, max_bytes: int = DEFAULT_CACHE_SIZE):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            data = self._items.get(key)
+            if data is None:
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return data
+
+    def put(self, key, data: bytes):
+        # 单个条目超过容量时不缓存，避免把其他条目全部挤出
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self.size -= len(old)
+            self._items[key] = data
+            self.size += len(data)
+            while self.size > self.max_bytes:
+                _, evicted = self._items.popitem(last=False)
+                self.size -= len(evicted)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self.size = 0
+
+# 所有档案共用一个缓存，同一封包被多次打开时也能命中
+_default_cache = DecodedCache()
+
+class PackArchive:
+    """只读封包档案：按需解压条目，解压结果缓存在LRU中
+
+    条目按封包大小表（与 g1t-export-tools.py 相同）划分，LZP2条目在首次访问时解压，
+    缓存键为 (封包路径, 修改时间, 条目序号)，封包被改写后旧缓存自然失效。
+    不是封包的文件视为只有一个条目。
+    """
+
+    def __init__(self, path: str, cache: DecodedCache = None):
+        self.path = os.path.abspath(path)
+        self.cache = _default_cache if cache is None else cache
+        self._file = open(self.path, 'rb')
+        self._mtime = os.fstat(self._file.fileno()).st_mtime_ns
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.entries = read_pack_table(self._mm) if looks_like_pack(self._mm) else [(0, len(self._mm))]
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if self._mm is not None:
+            self._mm.close()
+            self._file.close()
+            self._mm = None
+
+    def raw(self, index: int) -> bytes:
+        """条目在封包中的原始数据（不解压）"""
+        offset, size = self.entries[index]
+        return self._mm[offset:offset + size]
+
+    def compression(self, index: int):
+        """条目为LZP2时返回所用版本名（DW4/DW5 或 Orochi Z），否则返回None"""
+        offset, size = self.entries[index]
+        return lzp2.KNOWN_MAGICS.get(self._mm[offset:offset + 8]) if size >= 16 else None
+
+    def info(self, index: int) -> dict:
+        """条目信息，解压后大小直接取自LZP2文件头，不需要解压"""
+        offset, size = self.entries[index]
+        profile = self.compression(index)
+        decoded = int.from_bytes(self._mm[offset + 8:offset + 12], 'little') if profile else size
+        # 只识别已知的格式标记，任意二进制数据的前4字节不作为标记显示
+        kind = bytes(self._mm[offset:offset + 4]) if size >= 4 else b''
+        return {"index": index, "offset": offset, "size": size, "lzp2": profile,
+                "decoded_size": decoded, "tag": kind.decode('ascii') if kind in (G1T_TAG, TIM2_TAG) else None}
+
+    def read(self, index: int) -> bytes:
+        """条目数据，LZP2条目返回解压后的内容"""
+        offset, size = self.entries[index]
+        magic = self._mm[offset:offset + 8]
+        if size < 16 or magic not in lzp2.KNOWN_MAGICS:
+            return self.raw(index)
+
+        key = (self.path, self._mtime, index)
+        data = self.cache.get(key)
+        if data is None:
+            data = lzp2.decompress_lzp2_data(self._mm[offset:offset + size], magic)
+            self.cache.put(key, data)
+        return data
+
+    def open(self, index: int) -> io.BytesIO:
+        """以只读文件对象的形式打开条目（BytesIO直接共享缓存中的bytes，不额外复制）"""
+        return io.BytesIO(self.read(index))
+
+# -------------------------- 差分补丁 --------------------------
+def pack_layout(data) -> Tuple[int, List[Tuple[int, int]]]:
+    """返回 (第一个条目的偏移, 条目列表)；不是封包时整个文件作为一个条目"""
+    if not looks_like_pack(data):
+        return 0, [(0, len(data))]
+    entries = read_pack_table(data)
+    return entries[0][0], entries
+
+def entry_key(data, offset: int, size: int, semantic: bool = False) -> bytes:
+    """条目内容的摘要；semantic时LZP2条目按解压后的内容计算"""
+    magic = bytes(data[offset:offset + 8])
+    if semantic and size >= 16 and magic in lzp2.KNOWN_MAGICS:
+        payload = b'Z' + lzp2.decompress_lzp2_data(bytes(data[offset:offset + size]), magic)
+    else:
+        payload = b'R' + bytes(data[offset:offset + size])
+    return hashlib.blake2b(payload, digest_size=20).digest()
+
+def diff_ops(original, modified, semantic: bool = False) -> Tuple[list, int]:
+    """按条目比较两个封包，返回 (操作列表, 变化条目数)
+
+    新封包的每个条目若能在原封包中找到相同内容（不要求序号相同），生成COPY操作，
+    否则把新条目数据作为DATA。semantic时解压后内容相同的LZP2条目也直接复用原条目，
+    此时结果与修改后的封包内容等价但不逐字节相同，大小表按实际使用的条目重写。
+    连续的COPY在应用前会合并为一次大块复制。
+    """
+    _, old_entries = pack_layout(original)
+    header_end, new_entries = pack_layout(modified)
+    known = {}
+    for offset, size in old_entries:
+        if size:
+            known.setdefault(entry_key(original, offset, size, semantic), (offset, size))
+
+    ops = []
+    sizes = []
+    changed = 0
+    for offset, size in new_entries:
+        source = known.get(entry_key(modified, offset, size, semantic)) if size else None
+        if source is None:
+            ops.append((OP_DATA, bytes(modified[offset:offset + size])))
+            sizes.append(size)
+            changed += size > 0
+        else:
+            ops.append((OP_COPY, source))
+            sizes.append(source[1])
+
+    # 文件头：非封包时为空；封包时按实际使用的条目大小重写大小表
+    header = bytearray(modified[:header_end])
+    if header_end:
+        for index, size in enumerate(sizes):
+            header[4 + 4 * index:8 + 4 * index] = (size // 16).to_bytes(4, 'little')
+    end = new_entries[-1][0] + new_entries[-1][1]
+    tail = bytes(modified[end:])
+    if semantic and len(modified) % 2048 == 0 and not tail.strip(b'\x00'):
+        # 条目大小可能改变，按扇区重新计算末尾的零填充
+        tail = bytes(-(header_end + sum(sizes)) % 2048)
+    ops.insert(0, (OP_DATA, bytes(header)))
+    ops.append((OP_DATA, tail))
+    return merge_copies(ops), changed
+
+def merge_copies(ops: list) -> list:
+    """合并在原封包中首尾相接的COPY操作，去掉空的DATA"""
+    merged = []
+    for op, arg in ops:
+        if op == OP_DATA and not arg:
+            continue
+        if op == OP_COPY and merged and merged[-1][0] == OP_COPY:
+            offset, size = merged[-1][1]
+            if offset + size == arg[0]:
+                merged[-1] = (OP_COPY, (offset, size + arg[1]))
+                continue
+        merged.append((op, arg))
+    return merged
+
+def patched_chunks(original, ops) -> Iterator[bytes]:
+    """按操作列表产出结果封包的数据块，COPY按COPY_CHUNK分块直接从原封包切出"""
+    for op, arg in ops:
+        if op == OP_COPY:
+            offset, size = arg
+            for start in range(offset, offset + size, COPY_CHUNK):
+                yield original[start:min(start + COPY_CHUNK, offset + size)]
+        else:
+            yield arg
+
+def mmap_digest(data) -> bytes:
+    digest = hashlib.blake2b(digest_size=20)
+    for start in range(0, len(data), COPY_CHUNK):
+        digest.update(data[start:start + COPY_CHUNK])
+    return digest.digest()
+
+def create_patch(original_path: str, modified_path: str, patch_path: str, semantic: bool = False) -> dict:
+    """生成差分补丁，返回统计信息"""
+    with open(original_path, 'rb') as f1, open(modified_path, 'rb') as f2, \
+            mmap.mmap(f1.fileno(), 0, access=mmap.ACCESS_READ) as original, \
+            mmap.mmap(f2.fileno(), 0, access=mmap.ACCESS_READ) as modified:
+        ops, changed = diff_ops(original, modified, semantic)
+        # 模拟应用一遍得到结果的大小和摘要，供应用时校验
+        result_digest = hashlib.blake2b(digest_size=20)
+        result_size = 0
+        for chunk in patched_chunks(original, ops):
+            result_digest.update(chunk)
+            result_size += len(chunk)
+
+        with open(patch_path, 'wb') as out:
+            out.write(PATCH_HEADER.pack(PATCH_MAGIC, PATCH_VERSION, len(original), result_size,
+                                        mmap_digest(original), result_digest.digest(), len(ops)))
+            for op, arg in ops:
+                if op == OP_COPY:
+                    out.write(OP_COPY + struct.pack('<QQ', *arg))
+                else:
+                    blob = zlib.compress(arg, 9)
+                    out.write(OP_DATA + struct.pack('<II', len(arg), len(blob)) + blob)
+            patch_size = out.tell()
+
+    return {"ops": len(ops), "changed": changed, "result_size": result_size, "patch_size": patch_size}
+
+def read_patch(patch_path: str):
+    """读取补丁，返回 (原封包大小, 结果大小, 原封包摘要, 结果摘要, 操作列表)"""
+    with open(patch_path, 'rb') as f:
+        data = f.read()
+    magic, version, original_size, result_size, original_digest, result_digest, count = \
+        PATCH_HEADER.unpack_from(data)
+    if magic != PATCH_MAGIC or version != PATCH_VERSION:
+        raise ValueError("不是有效的补丁文件")
+
+    ops = []
+    pos = PATCH_HEADER.size
+    for _ in range(count):
+        op = data[pos:pos + 1]
+        if op == OP_COPY:
+            ops.append((OP_COPY, struct.unpack_from('<QQ', data, pos + 1)))
+            pos += 17
+        elif op == OP_DATA:
+            raw_size, blob_size = struct.unpack_from('<II', data, pos + 1)
+            payload = zlib.decompress(data[pos + 9:pos + 9 + blob_size])
+            if len(payload) != raw_size:
+                raise ValueError("补丁数据损坏")
+            ops.append((OP_DATA, payload))
+            pos += 9 + blob_size
+        else:
+            raise ValueError("补丁数据损坏")
+    return original_size, result_size, original_digest, result_digest, ops
+
+def apply_patch(original_path: str, patch_path: str, output_path: str) -> int:
+    """把补丁应用到原封包，校验原封包与结果的摘要，返回结果大小"""
+    original_size, result_size, original_digest, result_digest, ops = read_patch(patch_path)
+    with open(original_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as original:
+        if len(original) != original_size or mmap_digest(original) != original_digest:
+            raise ValueError("原封包与补丁不匹配")
+        digest = hashlib.blake2b(digest_size=20)
+        with open(output_path, 'wb') as out:
+            for chunk in patched_chunks(original, ops):
+                digest.update(chunk)
+                out.write(chunk)
+            written = out.tell()
+
+    if written != result_size or digest.digest() != result_digest:
+        os.remove(output_path)
+        raise ValueError("补丁应用结果校验失败")
+    return written
+
+# -------------------------- 命令行 --------------------------
+def parse_arguments():
+    parser = argparse.ArgumentParser(
+        description="封包/LZP2/G1T/TIM2 嵌套格式处理工具",
+        formatter_class=argparse.RawTextHelpFormatter
+    )
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    extract = sub.add_parser("extract", formatter_class=argparse.RawTextHelpFormatter,
+                             help="一次性解开封包→LZP2→G1T/TIM2，只写出最终文件\n"
+                                  "示例: packtools.py extract data.bin -o out/ --only g1t tm2")
+    extract.add_argument("inputs", nargs='+', help="封包文件路径")
+    extract.add_argument("-o", "--output", default="extracted",
+                         help="输出目录（默认：extracted）")
+    extract.add_argument("-j", "--jobs", type=int, default=0,
+                         help="并行进程数（默认：CPU核心数）")
+    extract.add_argument("--only", nargs='+', default=[], metavar="EXT",
+                         help="只输出指定类型，如 g1t tm2 bin")
+
+    ls = sub.add_parser("ls", help="列出封包条目（偏移、大小、类型、解压后大小）")
+    ls.add_argument("inputs", nargs='+', help="封包文件路径")
+
+    cat = sub.add_parser("cat", help="输出单个条目（LZP2条目自动解压）\n示例: packtools.py cat data.bin 12 -o 12.g1t")
+    cat.add_argument("input", help="封包文件路径")
+    cat.add_argument("index", type=int, help="条目序号")
+    cat.add_argument("-o", "--output", help="输出文件（默认写到标准输出）")
+
+    diff = sub.add_parser("diff", formatter_class=argparse.RawTextHelpFormatter,
+                          help="按条目比较原封包与修改后的封包，生成差分补丁\n"
+                               "示例: packtools.py diff orig.bin mod.bin -o mod.lzpd")
+    diff.add_argument("original", help="原封包")
+    diff.add_argument("modified", help="修改后的封包")
+    diff.add_argument("-o", "--output", required=True, help="补丁输出路径")
+    diff.add_argument("--semantic", action="store_true",
+                      help="解压后内容相同的LZP2条目也复用原条目（结果内容等价但不逐字节相同）")
+
+    apply = sub.add_parser("apply", help="把差分补丁应用到原封包\n示例: packtools.py apply orig.bin mod.lzpd -o new.bin")
+    apply.add_argument("original", help="原封包")
+    apply.add_argument("patch", help="补丁文件")
+    apply.add_argument("-o", "--output", required=True, help="结果封包输出路径")
+
+    return parser.parse_args()
+
+def main():
+    args = parse_arguments()
+
+    if args.command == "extract":
+        os.makedirs(args.output, exist_ok=True)
+        total = 0
+        for pack_path in args.inputs:
+            try:
+                total += extract_pack(pack_path, args.output, args.jobs, tuple(args.only))
+            except Exception as e:
+                print(f"[✗] 处理失败 {pack_path}: {str(e)}")
+        print(f"\n操作完成！共输出 {total} 个文件")
+
+    elif args.command == "ls":
+        for pack_path in args.inputs:
+            with PackArchive(pack_path) as archive:
+                print(f"{pack_path}: {len(archive)} 个条目")
+                for index in range(len(archive)):
+                    info = archive.info(index)
+                    kind = f"LZP2({info['lzp2']})" if info["lzp2"] else info["tag"] or "-"
+                    print(f"  {index:5d}  0x{info['offset']:08X}  {info['size']:10d}  "
+                          f"{info['decoded_size']:10d}  {kind}")
+
+    elif args.command == "diff":
+        stats = create_patch(args.original, args.modified, args.output, args.semantic)
+        print(f"补丁生成完成: {args.output}")
+        print(f"  变化条目: {stats['changed']}  操作数: {stats['ops']}")
+        print(f"  补丁大小: {stats['patch_size']} 字节（结果封包 {stats['result_size']} 字节）")
+
+    elif args.command == "apply":
+        try:
+            size = apply_patch(args.original, args.patch, args.output)
+        except ValueError as e:
+            print(f"[✗] {str(e)}")
+            sys.exit(1)
+        print(f"补丁应用完成: {args.output} ({size} 字节)")
+
+    elif args.command == "cat":
+        with PackArchive(args.input) as archive:
+            if not 0 <= args.index < len(archive):
+                print(f"[✗] 条目序号 {args.index} 超出范围（共 {len(archive)} 个条目，序号 0~{len(archive) - 1}）",
+                      file=sys.stderr)
+                sys.exit(1)
+            data = archive.read(args.index)
+        if args.output:
+            with open(args.output, 'wb') as f:
+                f.write(data)
+        else:
+            sys.stdout.buffer.write(data)
+
+if __name__ == "__main__":
+    main()
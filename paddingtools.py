@@ -1,144 +1,257 @@
-import os
-import sys
-
-def pad_or_truncate_file(filepath, target_size, auto_confirm=False):
-    """填充或截断单个文件到指定大小"""
-    try:
-        current_size = os.path.getsize(filepath)
-        
-        if current_size == target_size:
-            print(f"[{os.path.basename(filepath)}] 文件已满足大小，跳过")
-            return True
-        
-        elif current_size < target_size:
-            # 填充模式
-            with open(filepath, 'r+b') as f:
-                padding = target_size - current_size
-                f.seek(0, 2)
-                f.write(b'\x00' * padding)
-                print(f"[{os.path.basename(filepath)}] 填充 {padding} 字节")
-                return True
-        
-        else:
-            # 截断模式：当前大小 > 目标大小
-            if not auto_confirm:
-                response = input(f"文件 {os.path.basename(filepath)} 当前大小为 {current_size} 字节，"
-                               f"目标大小为 {target_size} 字节，\n"
-                               f"这将丢弃 {current_size - target_size} 字节数据。确认截断？(y/N): ")
-                if response.lower() != 'y':
-                    print(f"[{os.path.basename(filepath)}] 用户取消操作")
-                    return False
-            
-            # 执行截断
-            with open(filepath, 'r+b') as f:
-                f.truncate(target_size)
-                print(f"[{os.path.basename(filepath)}] 截断为 {target_size} 字节")
-                return True
-    
-    except Exception as e:
-        print(f"[{os.path.basename(filepath)}] 错误：{str(e)}")
-        return False
-
-def process_target(path, target_size, auto_confirm=False):
-    """处理文件或目录"""
-    if os.path.isfile(path):
-        pad_or_truncate_file(path, target_size, auto_confirm)
-    
-    elif os.path.isdir(path):
-        print(f"开始处理目录：{path}")
-        files_to_process = []
-        
-        # 收集需要处理的文件
-        for filename in os.listdir(path):
-            filepath = os.path.join(path, filename)
-            if os.path.isfile(filepath):
-                files_to_process.append(filepath)
-        
-        if not files_to_process:
-            print("目录中没有找到可处理的文件")
-            return
-        
-        print(f"找到 {len(files_to_process)} 个文件")
-        
-        # 对于目录，询问是否需要批量确认
-        will_truncate_files = []
-        for filepath in files_to_process:
-            current_size = os.path.getsize(filepath)
-            if current_size > target_size:
-                will_truncate_files.append((os.path.basename(filepath), current_size))
-        
-        if will_truncate_files and not auto_confirm:
-            print("\n以下文件将被截断（当前大小 > 目标大小）：")
-            for filename, size in will_truncate_files:
-                print(f"  - {filename}: {size} → {target_size} 字节 (丢弃 {size - target_size} 字节)")
-            
-            response = input(f"\n确认截断 {len(will_truncate_files)} 个文件？(y/N): ")
-            if response.lower() != 'y':
-                print("用户取消操作")
-                return
-        
-        # 处理文件
-        processed = 0
-        success = 0
-        for filepath in files_to_process:
-            processed += 1
-            if pad_or_truncate_file(filepath, target_size, auto_confirm or len(will_truncate_files) > 0):
-                success += 1
-        
-        print(f"处理完成：共 {processed} 个文件，成功 {success} 个")
-    
-    else:
-        raise ValueError("无效的路径类型")
-
-def main():
-    # 解析命令行参数
-    auto_confirm = False
-    args = sys.argv[1:]
-    
-    # 检查是否有 -y 或 --yes 参数
-    if '-y' in args or '--yes' in args:
-        auto_confirm = True
-        args = [arg for arg in args if arg not in ['-y', '--yes']]
-    
-    if len(args) != 2:
-        print("文件填充/截断工具")
-        print("使用方法：python pad_file.py <文件/目录路径> <目标大小> [-y]")
-        print("\n参数说明：")
-        print("  <文件/目录路径>  单个文件路径或目录路径")
-        print("  <目标大小>      目标字节数")
-        print("  -y, --yes       自动确认所有操作（危险：可能导致数据丢失）")
-        print("\n功能说明：")
-        print("  1. 如果文件小于目标大小，填充二进制00")
-        print("  2. 如果文件大于目标大小，截断文件（保留前N字节）")
-        print("  3. 截断操作需要用户确认（除非使用 -y 参数）")
-        print("\n示例：")
-        print("  填充单个文件：python pad_file.py test.bin 1024")
-        print("  处理整个目录：python pad_file.py ./data 2048")
-        print("  自动确认操作：python pad_file.py ./data 512 -y")
-        sys.exit(1)
-    
-    target_path = args[0]
-    target_size_arg = args[1]
-    
-    # 验证目标大小合法性
-    try:
-        target_size = int(target_size_arg)
-        if target_size <= 0:
-            raise ValueError("目标大小必须为正整数")
-    except ValueError:
-        print("错误：目标大小必须为正整数。")
-        sys.exit(1)
-    
-    # 验证路径存在性
-    if not os.path.exists(target_path):
-        print(f"错误：路径 '{target_path}' 不存在。")
-        sys.exit(1)
-    
-    try:
-        process_target(target_path, target_size, auto_confirm)
-    except Exception as e:
-        print(f"处理过程中发生错误：{str(e)}")
-        sys.exit(1)
-
-if __name__ == "__main__":
-    main()
+import os
+import sys
+import json
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+import telemetry
+from telemetry import Progress
+
+# 稠密填充的回退路径每次写入的零字节块大小
+ZERO_CHUNK = 1 << 20
+
+def extend_file(f, current_size, target_size, dense=False):
+    """把已打开的文件扩展到target_size，新增部分全部为00
+
+    默认用ftruncate直接修改文件长度，文件系统支持时新增区域为稀疏空洞，几乎不占时间和内存；
+    dense=True时用posix_fallocate实际分配磁盘块，系统不支持时退回分块写零。
+    """
+    fd = f.fileno()
+    if not dense:
+        os.ftruncate(fd, target_size)
+        return
+
+    length = target_size - current_size
+    if hasattr(os, 'posix_fallocate'):
+        try:
+            os.posix_fallocate(fd, current_size, length)
+            return
+        except OSError:
+            pass
+
+    zeros = bytes(min(ZERO_CHUNK, length))
+    f.seek(current_size)
+    while length > 0:
+        written = f.write(zeros[:length])
+        length -= written
+
+def pad_or_truncate_file(filepath, target_size, auto_confirm=False, dense=False,
+                         current_size=None, quiet=False):
+    """填充或截断单个文件到指定大小（current_size已知时不再重复stat）"""
+    def report(message):
+        if not quiet:
+            print(f"[{os.path.basename(filepath)}] {message}")
+
+    try:
+        if current_size is None:
+            current_size = os.path.getsize(filepath)
+        
+        if current_size == target_size:
+            report("文件已满足大小，跳过")
+            return True
+        
+        elif current_size < target_size:
+            # 填充模式
+            with open(filepath, 'r+b') as f:
+                padding = target_size - current_size
+                extend_file(f, current_size, target_size, dense)
+                report(f"填充 {padding} 字节")
+                return True
+        
+        else:
+            # 截断模式：当前大小 > 目标大小
+            if not auto_confirm:
+                response = input(f"文件 {os.path.basename(filepath)} 当前大小为 {current_size} 字节，"
+                               f"目标大小为 {target_size} 字节，\n"
+                               f"这将丢弃 {current_size - target_size} 字节数据。确认截断？(y/N): ")
+                if response.lower() != 'y':
+                    report("用户取消操作")
+                    return False
+            
+            # 执行截断
+            with open(filepath, 'r+b') as f:
+                f.truncate(target_size)
+                report(f"截断为 {target_size} 字节")
+                return True
+    
+    except Exception as e:
+        print(f"[{os.path.basename(filepath)}] 错误：{str(e)}")
+        return False
+
+def scan_files(path, recursive=False):
+    """用os.scandir遍历目录，每个文件只stat一次，逐个产出 (路径, 大小)"""
+    pending = [path]
+    while pending:
+        with os.scandir(pending.pop()) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    if recursive:
+                        pending.append(entry.path)
+                elif entry.is_file():
+                    yield entry.path, entry.stat().st_size
+
+def plan_files(files, target_size):
+    """根据已知大小生成处理计划：每项为 (路径, 当前大小, 操作)，操作为 pad/truncate/skip"""
+    plan = []
+    for filepath, current_size in files:
+        if current_size < target_size:
+            action = "pad"
+        elif current_size > target_size:
+            action = "truncate"
+        else:
+            action = "skip"
+        plan.append((filepath, current_size, action))
+    return plan
+
+def apply_plan(plan, target_size, dense=False, jobs=0, quiet=False, progress=None):
+    """用线程池并发执行计划（文件I/O为主，线程即可重叠等待），返回每项是否成功
+
+    progress按每个文件改变的字节数（填充或截断的长度）统计吞吐量；传入的progress由调用方负责结束。
+    """
+    workers = jobs or min(32, (os.cpu_count() or 1) + 4)
+    owns_progress = progress is None
+    progress = progress or Progress("padding", total_files=len(plan))
+
+    def run(item):
+        filepath, size, action = item
+        start = time.perf_counter()
+        ok = pad_or_truncate_file(filepath, target_size, True, dense, size, quiet)
+        progress.file_done(filepath, abs(target_size - size), time.perf_counter() - start, ok, action=action)
+        return ok
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(run, plan))
+    if owns_progress:
+        progress.finish()
+    return results
+
+def process_target(path, target_size, auto_confirm=False, dense=False, recursive=False,
+                   jobs=0, dry_run=False, as_json=False, quiet=False, progress=None):
+    """处理文件或目录；无论从哪条路径返回都会结束progress（写出汇总并关闭JSON Lines日志）"""
+    progress = progress or Progress("padding")
+    try:
+        run_target(path, target_size, auto_confirm, dense, recursive, jobs, dry_run, as_json, quiet, progress)
+    finally:
+        progress.finish()
+
+def run_target(path, target_size, auto_confirm, dense, recursive, jobs, dry_run, as_json, quiet, progress):
+    if os.path.isfile(path) and not (dry_run or as_json):
+        size = os.path.getsize(path)
+        action = plan_files([(path, size)], target_size)[0][2]
+        progress.add_total(1, abs(target_size - size))
+        start = time.perf_counter()
+        ok = pad_or_truncate_file(path, target_size, auto_confirm, dense, size)
+        progress.file_done(path, abs(target_size - size), time.perf_counter() - start, ok, action=action)
+        return
+
+    if os.path.isfile(path):
+        files = [(path, os.path.getsize(path))]
+    elif os.path.isdir(path):
+        if not as_json:
+            print(f"开始处理目录：{path}")
+        files = scan_files(path, recursive)
+    else:
+        raise ValueError("无效的路径类型")
+
+    plan = plan_files(files, target_size)
+    if not plan:
+        # JSON模式下输出空列表，保持输出可解析
+        print("[]" if as_json else "目录中没有找到可处理的文件")
+        return
+
+    will_truncate_files = [(filepath, size) for filepath, size, action in plan if action == "truncate"]
+    if not as_json:
+        print(f"找到 {len(plan)} 个文件：填充 {sum(1 for item in plan if item[2] == 'pad')} 个，"
+              f"截断 {len(will_truncate_files)} 个，"
+              f"跳过 {sum(1 for item in plan if item[2] == 'skip')} 个")
+
+    if dry_run:
+        if as_json:
+            print(json.dumps([{"path": filepath, "size": size, "target": target_size, "action": action}
+                              for filepath, size, action in plan], ensure_ascii=False, indent=1))
+        else:
+            for filepath, size, action in plan:
+                if action != "skip":
+                    print(f"  [{action}] {filepath}: {size} → {target_size} 字节")
+        return
+
+    if will_truncate_files and not auto_confirm:
+        # JSON模式下确认信息走stderr，stdout只保留可解析的结果
+        out = sys.stderr if as_json else sys.stdout
+        print("\n以下文件将被截断（当前大小 > 目标大小）：", file=out)
+        for filepath, size in will_truncate_files:
+            print(f"  - {filepath}: {size} → {target_size} 字节 (丢弃 {size - target_size} 字节)", file=out)
+        
+        print(f"\n确认截断 {len(will_truncate_files)} 个文件？(y/N): ", end="", file=out, flush=True)
+        response = input()
+        if response.lower() != 'y':
+            print("用户取消操作", file=out)
+            if as_json:
+                print("[]")
+            return
+
+    # 已跳过的文件无需再打开
+    todo = [item for item in plan if item[2] != "skip"]
+    progress.add_total(len(todo), sum(abs(target_size - size) for _, size, _ in todo))
+    results = apply_plan(todo, target_size, dense, jobs, quiet or as_json, progress)
+
+    if as_json:
+        print(json.dumps([{"path": filepath, "size": size, "target": target_size, "action": action, "ok": ok}
+                          for (filepath, size, action), ok in zip(todo, results)],
+                         ensure_ascii=False, indent=1))
+    else:
+        print(f"处理完成：共 {len(plan)} 个文件，成功 {sum(results) + len(plan) - len(todo)} 个")
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="文件填充/截断工具",
+        formatter_class=argparse.RawTextHelpFormatter,
+        epilog="功能说明：\n"
+               "  1. 如果文件小于目标大小，填充二进制00\n"
+               "  2. 如果文件大于目标大小，截断文件（保留前N字节）\n"
+               "  3. 截断操作需要用户确认（除非使用 -y 参数）\n"
+               "\n示例：\n"
+               "  填充单个文件：python paddingtools.py test.bin 1024\n"
+               "  处理整个目录：python paddingtools.py ./data 2048\n"
+               "  自动确认操作：python paddingtools.py ./data 512 -y\n"
+               "  递归预览计划：python paddingtools.py ./data 2048 -r --dry-run --json"
+    )
+    parser.add_argument("path", help="单个文件路径或目录路径")
+    parser.add_argument("target_size", help="目标字节数")
+    parser.add_argument("-y", "--yes", action="store_true",
+                        help="自动确认所有操作（危险：可能导致数据丢失）")
+    parser.add_argument("--dense", action="store_true",
+                        help="实际分配填充区域的磁盘空间（默认生成稀疏文件）")
+    parser.add_argument("-r", "--recursive", action="store_true", help="递归处理子目录")
+    parser.add_argument("-j", "--jobs", type=int, default=0, help="并发线程数（默认：自动）")
+    parser.add_argument("--dry-run", action="store_true", help="只输出处理计划，不修改文件")
+    parser.add_argument("--json", action="store_true", help="以JSON输出计划/结果")
+    parser.add_argument("-q", "--quiet", action="store_true", help="不输出逐个文件的信息")
+    telemetry.add_arguments(parser, quiet=False)
+    args = parser.parse_args()
+    
+    # 验证目标大小合法性
+    try:
+        target_size = int(args.target_size)
+        if target_size <= 0:
+            raise ValueError("目标大小必须为正整数")
+    except ValueError:
+        print("错误：目标大小必须为正整数。")
+        sys.exit(1)
+    
+    # 验证路径存在性
+    if not os.path.exists(args.path):
+        print(f"错误：路径 '{args.path}' 不存在。")
+        sys.exit(1)
+    
+    try:
+        process_target(args.path, target_size, args.yes, args.dense, args.recursive,
+                       args.jobs, args.dry_run, args.json, args.quiet,
+                       Progress("padding", live=args.progress, jsonl_path=args.log_jsonl))
+    except Exception as e:
+        print(f"处理过程中发生错误：{str(e)}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
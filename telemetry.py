@@ -0,0 +1,158 @@
+import sys
+import json
+import time
+import heapq
+import threading
+from contextlib import contextmanager
+
+# 实时进度行的最小刷新间隔（秒），避免小文件场景下输出本身成为瓶颈
+DEFAULT_INTERVAL = 1.0
+
+def format_eta(seconds):
+    """把秒数格式化为 HH:MM:SS"""
+    seconds = int(seconds)
+    return f"{seconds // 3600:02d}:{seconds // 60 % 60:02d}:{seconds % 60:02d}"
+
+class Progress:
+    """批量工具共用的进度/遥测记录器
+
+    记录每个文件的字节数与耗时，按间隔节流输出 MB/s、文件/s、ETA 的实时进度行，
+    统计最慢的文件和各阶段累计耗时，并可把事件以 JSON Lines 写入日志文件供CI采集。
+    所有方法都是线程安全的。
+    """
+
+    def __init__(self, label="", total_files=None, total_bytes=None, live=False, jsonl_path=None,
+                 quiet=False, interval=DEFAULT_INTERVAL, slowest=5, stream=None):
+        self.label = label
+        self.total_files = total_files
+        self.total_bytes = total_bytes
+        self.live = live
+        self.quiet = quiet
+        self.interval = interval
+        self.slowest_count = slowest
+        self.stream = stream or sys.stderr
+
+        self.files = 0
+        self.failed = 0
+        self.bytes = 0
+        self.stages = {}
+        self._slowest = []
+        self._lock = threading.Lock()
+        self._start = time.perf_counter()
+        self._last_report = self._start
+        self._jsonl = open(jsonl_path, 'a', encoding='utf-8') if jsonl_path else None
+        self._emit({"event": "start", "label": label, "total_files": total_files, "total_bytes": total_bytes})
+
+    def _emit(self, event):
+        if self._jsonl is not None:
+            event["time"] = round(time.time(), 3)
+            self._jsonl.write(json.dumps(event, ensure_ascii=False) + "\n")
+
+    def log(self, message):
+        """输出逐个文件的提示信息（quiet时不输出）"""
+        if not self.quiet:
+            print(message)
+
+    def add_total(self, files=0, nbytes=0):
+        """边遍历边处理时，发现新文件后追加总量"""
+        with self._lock:
+            self.total_files = (self.total_files or 0) + files
+            self.total_bytes = (self.total_bytes or 0) + nbytes
+
+    def add_stage(self, name, seconds):
+        """累计某个阶段（读取/编解码/写入等）的耗时"""
+        with self._lock:
+            self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_stage(name, time.perf_counter() - start)
+
+    def file_done(self, path, nbytes=0, seconds=0.0, ok=True, **extra):
+        """记录一个文件处理完成"""
+        with self._lock:
+            self.files += 1
+            self.bytes += nbytes
+            if not ok:
+                self.failed += 1
+            item = (seconds, str(path))
+            if len(self._slowest) < self.slowest_count:
+                heapq.heappush(self._slowest, item)
+            else:
+                heapq.heappushpop(self._slowest, item)
+            self._emit({"event": "file", "path": str(path), "bytes": nbytes,
+                        "seconds": round(seconds, 4), "ok": ok, **extra})
+
+            now = time.perf_counter()
+            if now - self._last_report >= self.interval:
+                self._last_report = now
+                self._report(now)
+
+    def snapshot(self, now=None):
+        """当前吞吐量统计"""
+        elapsed = max((now or time.perf_counter()) - self._start, 1e-9)
+        stats = {
+            "files": self.files,
+            "failed": self.failed,
+            "bytes": self.bytes,
+            "elapsed": round(elapsed, 3),
+            "mb_per_s": round(self.bytes / elapsed / 1e6, 3),
+            "files_per_s": round(self.files / elapsed, 3),
+            "eta": None,
+        }
+        # 优先按字节估算剩余时间，不知道总字节数时按文件数估算
+        if self.total_bytes and self.bytes:
+            stats["eta"] = round(elapsed * (self.total_bytes - self.bytes) / self.bytes, 1)
+        elif self.total_files and self.files:
+            stats["eta"] = round(elapsed * (self.total_files - self.files) / self.files, 1)
+        return stats
+
+    def _report(self, now):
+        stats = self.snapshot(now)
+        self._emit({"event": "progress", **stats})
+        if self.live:
+            total = f"/{self.total_files}" if self.total_files else ""
+            eta = f" | ETA {format_eta(stats['eta'])}" if stats["eta"] is not None else ""
+            self.stream.write(f"[{self.label or '进度'}] {self.files}{total} 文件 | "
+                              f"{stats['mb_per_s']:.2f} MB/s | {stats['files_per_s']:.1f} 文件/s{eta}\n")
+            self.stream.flush()
+
+    def slowest(self):
+        """最慢的若干文件，按耗时从大到小排列"""
+        with self._lock:
+            return sorted(self._slowest, reverse=True)
+
+    def finish(self):
+        """输出汇总（实时模式下）并写出summary事件，关闭日志文件"""
+        stats = self.snapshot()
+        slowest = self.slowest()
+        self._emit({"event": "summary", **stats,
+                    "stages": {name: round(seconds, 4) for name, seconds in self.stages.items()},
+                    "slowest": [{"path": path, "seconds": round(seconds, 4)} for seconds, path in slowest]})
+        if self.live:
+            self.stream.write(f"[{self.label or '进度'}] 共 {stats['files']} 个文件（失败 {stats['failed']}），"
+                              f"{stats['bytes'] / 1e6:.2f} MB，用时 {stats['elapsed']:.2f} 秒，"
+                              f"{stats['mb_per_s']:.2f} MB/s，{stats['files_per_s']:.1f} 文件/s\n")
+            if self.stages:
+                self.stream.write("  阶段耗时: " + ", ".join(
+                    f"{name} {seconds:.2f}s" for name, seconds in self.stages.items()) + "\n")
+            for seconds, path in slowest:
+                self.stream.write(f"  最慢: {seconds:8.3f}s  {path}\n")
+            self.stream.flush()
+        if self._jsonl is not None:
+            self._jsonl.close()
+            self._jsonl = None
+        return stats
+
+def add_arguments(parser, quiet=True):
+    """为各批量工具的argparse添加统一的遥测选项"""
+    parser.add_argument("--progress", action="store_true",
+                        help="在stderr输出节流后的实时进度（MB/s、文件/s、ETA）及最慢文件汇总")
+    parser.add_argument("--log-jsonl", metavar="FILE",
+                        help="以JSON Lines格式追加写入逐文件事件、进度和汇总")
+    if quiet:
+        parser.add_argument("-q", "--quiet", action="store_true", help="不输出逐个文件的信息")